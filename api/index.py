@@ -1,4 +1,11 @@
-from app import app
+import os
 
-# For Vercel Python serverless function
+# The results.db bundled with the function is read-only and never changes
+# while it is deployed. It is in WAL mode (see db.INGEST_PRAGMAS), and SQLite
+# can only open a WAL database on a read-only file system as immutable;
+# otherwise it tries to create the -shm file and the open fails.
+os.environ.setdefault('RESULTS_DB_IMMUTABLE', '1')
+
+from app import app  # noqa: E402
 
+# For Vercel Python serverless function
@@ -0,0 +1,196 @@
+import base64
+import csv
+import io
+import json
+import math
+import zlib
+
+from flask import Blueprint, Response, abort, jsonify, request
+
+import queries
+import shards
+from db import RANK_COLUMNS, read_connection
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+MAX_LIMIT = 1000
+SUGGEST_LIMIT = 8
+SUGGEST_MAX_AGE = 60
+EXPORT_BATCH = 1000
+EXPORT_FIELDS = ('roll', 'name', 'gpa', 'group', 'school_name', 'total_marks') + RANK_COLUMNS + ('marks',)
+
+
+def encode_cursor(row):
+    raw = json.dumps([row['total_marks'], row['roll']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _is_number(value, types):
+    if isinstance(value, bool) or not isinstance(value, types):
+        return False
+    return math.isfinite(value) and abs(value) < 2 ** 63
+
+
+def decode_cursor(cursor):
+    """(total_marks, roll) from a cursor; anything else is a 400.
+
+    The types are checked too: SQLite would compare a string total with
+    every number and quietly return the first page again.
+    """
+    try:
+        total, roll = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        abort(400, description='invalid cursor')
+    if not (_is_number(total, (int, float)) and _is_number(roll, int)):
+        abort(400, description='invalid cursor')
+    return total, roll
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def json_error(error):
+    return jsonify(error=error.description), error.code
+
+
+def leaderboard_response(institute=None):
+    group = request.args.get('group', 'all')
+    limit = request.args.get('limit', queries.PER_PAGE, type=int)
+    if not 1 <= limit <= MAX_LIMIT:
+        abort(400, description=f'limit must be between 1 and {MAX_LIMIT}')
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+
+    board, year = request.args.get('board'), request.args.get('year', type=int)
+    if board is not None:
+        conn = shards.shard_connection(board, year)
+        if conn is None:
+            abort(404, description='no shard for this board and year')
+        students = queries.leaderboard_after(conn, group, institute, after, limit)
+    elif year is not None:
+        conns = shards.year_connections(year)
+        if not conns:
+            abort(404, description='no shards for this year')
+        students = queries.merged_leaderboard_after(conns, group, institute, after, limit)
+    else:
+        students = queries.leaderboard_after(read_connection(), group, institute, after, limit)
+    next_cursor = encode_cursor(students[-1]) if len(students) == limit else None
+    return jsonify(students=students, next_cursor=next_cursor)
+
+
+@api.route('/leaderboard')
+def leaderboard():
+    """GPA-5 leaderboard, `limit` rows at a time; pass back `next_cursor`.
+
+    `board` (and optionally `year`) reads one board's shard; `year` alone
+    ranks every board of that year together.
+    """
+    return leaderboard_response()
+
+
+@api.route('/shards')
+def shard_list():
+    return jsonify(shards=shards.shard_catalog())
+
+
+@api.route('/institutes')
+def institutes():
+    return jsonify(institutes=queries.institutes(read_connection()))
+
+
+@api.route('/institutes/<string:school>')
+def institute(school):
+    """One institute's students by total marks, keyset-paginated."""
+    return leaderboard_response(school)
+
+
+@api.route('/suggest')
+def suggest():
+    """Autocomplete: institutes and students matching `q` as typed so far."""
+    text = request.args.get('q', '')
+    conn = read_connection()
+    response = jsonify(
+        institutes=queries.search_institutes(conn, text, SUGGEST_LIMIT),
+        students=queries.search_students(conn, text, SUGGEST_LIMIT),
+    )
+    response.cache_control.public = True
+    response.cache_control.max_age = SUGGEST_MAX_AGE
+    return response
+
+
+@api.route('/results/<int:roll>')
+def result(roll):
+    conn = read_connection()
+    row = conn.execute(
+        f"SELECT rowid AS student_id, {queries.LEADERBOARD_COLUMNS} FROM student WHERE roll_no = ?",
+        (roll,),
+    ).fetchone()
+    if row is None:
+        abort(404, description='student not found')
+    student = dict(row)
+    student['ranks'] = queries.student_ranks(conn, student.pop('student_id'))
+    student['subjects'] = queries.student_marks(conn, roll)
+    return jsonify(student)
+
+
+def _batches(rows, serialize):
+    """Join serialized rows into EXPORT_BATCH-sized chunks."""
+    batch = []
+    for row in rows:
+        batch.append(serialize(row))
+        if len(batch) == EXPORT_BATCH:
+            yield ''.join(batch).encode()
+            batch = []
+    if batch:
+        yield ''.join(batch).encode()
+
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
+
+
+@api.route('/export')
+def export():
+    """Stream every student as CSV or NDJSON, gzipped when the client accepts it.
+
+    Rows go from the SQLite cursor to the socket in batches, so memory use
+    does not depend on the size of the board.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        abort(400, description='format must be csv or ndjson')
+    rows = queries.iter_students(
+        read_connection(), request.args.get('group', 'all'), request.args.get('institute')
+    )
+
+    if fmt == 'csv':
+        chunks = _batches(rows, lambda row: _csv_line(tuple(row)))
+        chunks = _prepend(_csv_line(EXPORT_FIELDS).encode(), chunks)
+        mimetype = 'text/csv'
+    else:
+        chunks = _batches(rows, lambda row: json.dumps(dict(row)) + '\n')
+        mimetype = 'application/x-ndjson'
+
+    headers = {
+        'Content-Disposition': f'attachment; filename=results.{fmt}',
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        chunks = _gzip(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(chunks, mimetype=mimetype, headers=headers)
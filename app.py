@@ -1,123 +1,137 @@
-from flask import Flask, render_template, request
-import sqlite3
-import math
+from flask import Flask, abort, make_response, render_template, request
 import os
+from urllib.parse import urlencode
 
-app = Flask(__name__)
-
+import metrics
+import queries
+import shards
+from api_v1 import api
+from db import read_connection, read_version
+from page_cache import PageCache
+from snapshot import current_snapshot
 
-subject_id_name_map = {
-    '101': 'Bangla',
-    '107': 'English',
-    '108': 'English 2nd Paper',
-    '154': 'Information & Communication Technology',
-    '126' : 'Higer Mathematics',
-    '152': 'Finance and Banking',
-    '143': 'Business Entrepreneurship',
-    '147': 'Physical Education, Health, and Sports',
-    '153': 'History of Bangladesh and World Civilization',
-    '134': 'Agriculture Studies ',
-    '111': 'Islam and Moral Education',
-    '112': 'Hindu and Moral Education',
-    '127': 'Science',
-    '150': 'Bangladesh and Global Studies',
-    '156': 'Career Education',
-    '110': 'Geography and Environment (Old)',
-    '109': 'Mathematics',
-    '136' : 'Physics',
-    '138' : 'Biology',
-    '137' : 'Chemistry',
-    '146' : 'Accounting',
-    '151' :'Home Science',
-    '153' :'HISTORY OF BANGLADESH AND WORLD CIVILIZATION',
-    '140' : 'CIVICS AND CITIZENSHIP',
-    '110' :'GEOGRAPHY AND ENVIRONMENT'
-}
+app = Flask(__name__)
+app.register_blueprint(api)
+
+# Rendered leaderboard pages are shared by every visitor until the next ingest.
+page_cache = PageCache(int(os.environ.get('PAGE_CACHE_BYTES', 64 * 1024 * 1024)))
+metrics.init_app(app, page_cache)
+BROWSER_MAX_AGE = 60
+CDN_MAX_AGE = 300
+
+
+def cached_page(key, version, updated_at, render):
+    """Serve a page from the page cache with HTTP validators.
+
+    `render` is only called on a cache miss, and returns None when there is
+    no such page (a 404, not cached). The ETag is the body's digest, so
+    browsers and the CDN revalidate with a 304 until the data changes.
+    """
+    entry = page_cache.get(key, version)
+    if entry is None:
+        body = render()
+        if body is None:
+            return "Not found", 404
+        entry = page_cache.put(key, version, body)
+    body, etag = entry
+
+    response = make_response(body)
+    response.set_etag(etag)
+    if updated_at is not None:
+        response.last_modified = float(updated_at)
+    response.cache_control.public = True
+    response.cache_control.max_age = BROWSER_MAX_AGE
+    response.cache_control.s_maxage = CDN_MAX_AGE
+    return response.make_conditional(request)
+
+
+def selected_shard():
+    """(board slug, year) picked by ?board=<slug>&year=<year>, or (None, None).
+
+    `year` only applies together with `board`; without it the board's latest
+    shard is read. Pages that span every board read results.db.
+    """
+    board = request.args.get('board') or None
+    return board, (request.args.get('year', type=int) if board else None)
+
+
+def data_connection():
+    """The read connection for this request: the selected shard or results.db."""
+    board, year = selected_shard()
+    if board is None:
+        return read_connection()
+    conn = shards.shard_connection(board, year)
+    if conn is None:
+        abort(404, description='No results for this board and year.')
+    return conn
+
+
+@app.context_processor
+def shard_links():
+    """Links between pages stay on the selected shard."""
+    board, year = selected_shard()
+    query = urlencode({k: v for k, v in (('board', board), ('year', year)) if v is not None})
+
+    def shard_url(path):
+        return f'{path}?{query}' if query else path
+
+    return {'shard_query': query, 'shard_url': shard_url}
+
+
+def render_leaderboard(institute=None):
+    search_roll = request.args.get('roll', '').strip()
+    selected_group = request.args.get('group', 'all')
+    page = request.args.get('page', 1, type=int)
+    # A subject code: rank by marks in that subject instead of total marks.
+    sort = request.args.get('sort') or None
+
+    conn = data_connection()
+    version, updated_at = read_version(conn)
+    # Only results.db has a NumPy snapshot; shards rank in SQLite.
+    snapshot = current_snapshot() if selected_shard()[0] is None else None
+
+    def render():
+        nonlocal page
+        # Roll filter (disable pagination)
+        if search_roll:
+            student = queries.find_in_leaderboard(conn, search_roll, selected_group, institute)
+            page_students = [student] if student else []
+            total_pages = 1
+        elif snapshot is not None and snapshot.version == version:
+            rowids, ranks, page, total_pages = snapshot.leaderboard_page(
+                selected_group, institute, page, subject=sort
+            )
+            page_students = queries.students_by_rowid(conn, rowids, ranks)
+        else:
+            page_students, page, total_pages = queries.leaderboard_page(
+                conn, selected_group, institute, page, subject=sort
+            )
+
+        return render_template(
+            'students.html',
+            students=page_students,
+            search_roll=search_roll,
+            selected_group=selected_group,
+            sort=sort,
+            page=page,
+            total_pages=total_pages
+        )
+
+    key = (request.path, *selected_shard(), selected_group, page, search_roll, sort)
+    return cached_page(key, version, updated_at, render)
 
 
 @app.route('/')
 def show_student_totals():
-    search_roll = request.args.get('roll', '').strip()
-    selected_group = request.args.get('group', 'all')
-    page = int(request.args.get('page', 1))
-    per_page = 100
-
-    conn = sqlite3.connect('results.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    # Get subject columns
-    cursor.execute("PRAGMA table_info(students);")
-    all_cols = [col[1] for col in cursor.fetchall()]
-    exclude_cols = ('roll', 'gpa', 'group_name', 'school_name', 'board', 'zilla', 'thana')
-    marks_cols = [c for c in all_cols if c not in exclude_cols]
-
-    # Get all student rows
-    cursor.execute("SELECT * FROM student where gpa = 5.0")
-    rows = cursor.fetchall()
-
-    students = []
-    for row in rows:
-        subject_marks = {
-        col: row[col] for col in marks_cols if row[col] not in (None, 0)
-        }
-        total = sum(float(row[col] or 0) for col in marks_cols)
-
-        students.append({
-            
-            'roll': row['roll_no'],
-            'name' : row['name'],
-            'gpa': row['gpa'],
-            'group': row['group'],
-            'school_name': row['institute'],
-            'total_marks': row['sum'],
-            'subject_marks': subject_marks
-        })
-
-    # Group filter
-    if selected_group.lower() != 'all':
-        filtered_students = [s for s in students if s['group'].lower() == selected_group.lower()]
-    else:
-        filtered_students = students
-
-    filtered_students.sort(key=lambda x: x['total_marks'], reverse=True)
-
-    # Assign rank
-    for idx, s in enumerate(filtered_students, start=1):
-        s['rank'] = idx
-
-    # Roll filter (disable pagination)
-    if search_roll:
-        filtered_students = [s for s in filtered_students if str(s['roll']) == search_roll]
-        total_pages = 1
-        page_students = filtered_students
-    else:
-        total_students = len(filtered_students)
-        total_pages = math.ceil(total_students / per_page)
-        page = max(1, min(page, total_pages))
-        start = (page - 1) * per_page
-        end = start + per_page
-        page_students = filtered_students[start:end]
-
-    conn.close()
+    return render_leaderboard()
 
-    return render_template(
-        'students.html',
-        students=page_students,
-        search_roll=search_roll,
-        selected_group=selected_group,
-        page=page,
-        total_pages=total_pages
-    )
 
 @app.route('/result/<int:roll>')
 def student_result(roll):
-    conn = sqlite3.connect('results.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM student WHERE roll_no = ?", (roll,))
-    row = cursor.fetchone()
+    conn = data_connection()
+    row = conn.execute(
+        "SELECT rowid AS student_id, * FROM student WHERE roll_no = ?", (roll,)
+    ).fetchone()
 
     if row is None:
         return "Student not found", 404
@@ -125,87 +139,70 @@ def student_result(roll):
     
 
     student = dict(row)  # ✅ Convert entire row to dictionary
-    items = list(student.items())
-    sum_index = next(i for i, (k, v) in enumerate(items) if k == 'sum')
-    print(student)
-    subjects = {k: v for k, v in items[sum_index+1:] if v is not None}
-    subjects.pop('createdAt', None)  # Remove createdAt if exists
-    subjects.pop('updatedAt', None)
-    return render_template('student_result.html', student=student, subjects= subjects)
+    ranks = queries.student_ranks(conn, student.pop('student_id'))
+    subjects = queries.student_marks(conn, roll)
+    if not subjects:
+        # Not ingested into the marks table: fall back to the subject columns
+        # that follow `sum` in the wide student row.
+        items = list(student.items())
+        sum_index = next(i for i, (k, v) in enumerate(items) if k == 'sum')
+        subjects = {k: v for k, v in items[sum_index+1:] if v is not None}
+        subjects.pop('createdAt', None)  # Remove createdAt if exists
+        subjects.pop('updatedAt', None)
+    return render_template('student_result.html', student=student, subjects= subjects, ranks=ranks)
 
 @app.route('/ins/<string:school>')
 def institute_result(school):
-    search_roll = request.args.get('roll', '').strip()
-    selected_group = request.args.get('group', 'all')
-    page = int(request.args.get('page', 1))
-    per_page = 100
-
-    conn = sqlite3.connect('results.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    # Get subject columns
-    cursor.execute("PRAGMA table_info(students);")
-    all_cols = [col[1] for col in cursor.fetchall()]
-    exclude_cols = ('roll', 'gpa', 'group_name', 'school_name', 'board', 'zilla', 'thana')
-    marks_cols = [c for c in all_cols if c not in exclude_cols]
-
-    # Get all student rows
-    cursor.execute("SELECT * FROM student where institute = ? " ,(school ,))
-    rows = cursor.fetchall()
-
-    students = []
-    for row in rows:
-        subject_marks = {
-        col: row[col] for col in marks_cols if row[col] not in (None, 0)
-        }
-        total = sum(float(row[col] or 0) for col in marks_cols)
-
-        students.append({
-            
-            'roll': row['roll_no'],
-            'name' : row['name'],
-            'gpa': row['gpa'],
-            'group': row['group'],
-            'school_name': row['institute'],
-            'total_marks': row['sum'],
-            'subject_marks': subject_marks
-        })
-
-    # Group filter
-    if selected_group.lower() != 'all':
-        filtered_students = [s for s in students if s['group'].lower() == selected_group.lower()]
-    else:
-        filtered_students = students
-
-    filtered_students.sort(key=lambda x: x['total_marks'], reverse=True)
-
-    # Assign rank
-    for idx, s in enumerate(filtered_students, start=1):
-        s['rank'] = idx
-
-    # Roll filter (disable pagination)
-    if search_roll:
-        filtered_students = [s for s in filtered_students if str(s['roll']) == search_roll]
-        total_pages = 1
-        page_students = filtered_students
-    else:
-        total_students = len(filtered_students)
-        total_pages = math.ceil(total_students / per_page)
-        page = max(1, min(page, total_pages))
-        start = (page - 1) * per_page
-        end = start + per_page
-        page_students = filtered_students[start:end]
-
-    conn.close()
-
+    return render_leaderboard(institute=school)
+
+@app.route('/stats')
+def board_stats():
+    conn = data_connection()
+    version, updated_at = read_version(conn)
+
+    def render():
+        return render_template(
+            'stats.html',
+            institute=None,
+            overall=queries.cohort_stats(conn, 'group'),
+            boards=queries.cohort_stats(conn, 'board'),
+            subjects=[s for s in queries.cohort_stats(conn, 'subject') if s['group_name'] == 'all'],
+            subject_names=queries.subject_names(conn),
+            institutes=queries.top_institutes(conn),
+        )
+
+    return cached_page((request.path, *selected_shard()), version, updated_at, render)
+
+@app.route('/stats/<string:school>')
+def institute_stats(school):
+    conn = data_connection()
+    version, updated_at = read_version(conn)
+
+    def render():
+        overall = queries.cohort_stats(conn, 'institute', school)
+        if not overall:
+            return None
+        return render_template(
+            'stats.html',
+            institute=school,
+            overall=overall,
+            boards=[],
+            subjects=[],
+            subject_names={},
+            institutes=[],
+        )
+
+    return cached_page((request.path, *selected_shard()), version, updated_at, render)
+
+@app.route('/search')
+def search():
+    text = request.args.get('q', '').strip()
+    conn = data_connection()
     return render_template(
-        'students.html',
-        students=page_students,
-        search_roll=search_roll,
-        selected_group=selected_group,
-        page=page,
-        total_pages=total_pages
+        'search.html',
+        query=text,
+        institutes=queries.search_institutes(conn, text) if text else [],
+        students=queries.search_students(conn, text) if text else [],
     )
 
 @app.route('/about')
@@ -0,0 +1,194 @@
+import argparse
+import os
+import random
+
+BOARD = 'BOARD OF INTERMEDIATE AND SECONDARY EDUCATION, CHATTOGRAM'
+EXAM = 'HIGHER SECONDARY CERTIFICATE EXAMINATION 2025'
+STUDENTS_PER_INSTITUTE = 250
+# Subject codes taken by each group (see db.subject_id_name_map).
+GROUP_SUBJECTS = {
+    'Science': ('101', '107', '154', '136', '137', '138', '126'),
+    'Business Studies': ('101', '107', '154', '146', '143', '152', '109'),
+    'Humanities': ('101', '107', '154', '153', '140', '110', '150'),
+}
+GROUP_WEIGHTS = (0.45, 0.25, 0.30)
+# (lowest percentage, grade point), best first; under 33 is a fail.
+GRADE_POINTS = ((80, 5.0), (70, 4.0), (60, 3.5), (50, 3.0), (40, 2.0), (33, 1.0))
+FIRST_NAMES = ('MD.', 'MST.', 'ABDUL', 'NUSRAT', 'TANVIR', 'FARHANA', 'RAKIB', 'SADIA', 'ARIF', 'JANNAT')
+LAST_NAMES = ('HOSSAIN', 'RAHMAN', 'ISLAM', 'AKTER', 'CHOWDHURY', 'UDDIN', 'BEGUM', 'KHAN', 'DAS', 'ALAM')
+
+# Minimal PDF: A4 landscape, Helvetica (a standard font, so no font file is
+# embedded), one uncompressed content stream per page.
+PAGE_WIDTH, PAGE_HEIGHT = 842, 595
+FONT_SIZE = 8
+LEADING = 10
+LINES_PER_PAGE = 52
+
+
+def grade_point(marks):
+    for lowest, point in GRADE_POINTS:
+        if marks >= lowest:
+            return point
+    return 0.0
+
+
+def make_student(rng, roll, group, institute):
+    """One synthetic student; marks are out of 100 per subject."""
+    ability = rng.gauss(72, 14)
+    marks = {
+        code: max(0, min(100, round(rng.gauss(ability, 7))))
+        for code in GROUP_SUBJECTS[group]
+    }
+    points = [grade_point(m) for m in marks.values()]
+    gpa = 0.0 if 0.0 in points else min(5.0, sum(points) / len(points))
+    return {
+        'roll': roll,
+        'gpa': round(gpa, 2),
+        'group': group,
+        'school_name': institute,
+        'board': BOARD,
+        'subjects': marks,
+        'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}',
+    }
+
+
+def generate_board(students=10000, per_institute=STUDENTS_PER_INSTITUTE, seed=2025):
+    """Synthetic board results: [(institute, [student, ...]), ...].
+
+    Rolls are unique six-digit numbers, institutes are of roughly
+    `per_institute` students each and students are spread over the three
+    groups. The same arguments always produce the same board.
+    """
+    rng = random.Random(seed)
+    institutes = []
+    roll = 100000
+    remaining = students
+    code = 1000
+    while remaining > 0:
+        size = min(remaining, max(1, round(rng.gauss(per_institute, per_institute / 4))))
+        code += 1
+        # The code goes inside the name: the parser strips trailing digits.
+        name = f'{rng.choice(LAST_NAMES)} {code} {rng.choice(("COLLEGE", "SCHOOL AND COLLEGE", "MODEL COLLEGE"))}'
+        groups = rng.choices(list(GROUP_SUBJECTS), GROUP_WEIGHTS, k=size)
+        members = []
+        for group in GROUP_SUBJECTS:
+            for _ in range(groups.count(group)):
+                roll += rng.randint(1, 3)
+                members.append(make_student(rng, str(roll), group, name))
+        institutes.append((name, code, members))
+        remaining -= size
+    return institutes
+
+
+def institute_lines(name, code, students):
+    """Result-sheet text of one institute, in the layout the parser reads."""
+    lines = [BOARD, EXAM, 'RESULT SHEET', f'INSTITUTE NAME : {name} ({code})', '']
+    for group in GROUP_SUBJECTS:
+        members = [s for s in students if s['group'] == group]
+        if not members:
+            continue
+        passed = sum(1 for s in members if s['gpa'] > 0)
+        gpa5 = sum(1 for s in members if s['gpa'] == 5.0)
+        lines += [
+            f'GROUP : {group.upper()}',
+            f'TOTAL EXAMINEES : {len(members)} PASS : {passed} GPA5 : {gpa5} '
+            f'PERCENT : {100 * passed / len(members):.2f}',
+        ]
+        lines += [
+            f"{s['roll']}[{s['gpa']:.2f}]:" + ','.join(f'{c}:T:{m}' for c, m in s['subjects'].items())
+            for s in members
+        ]
+        lines.append('')
+    return lines
+
+
+def _pdf_string(text):
+    return '(' + text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def write_pdf(path, lines):
+    """Write `lines` to a text-only PDF that pdfminer can extract."""
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    objects = [None, None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for page in pages:
+        body = [f'BT /F1 {FONT_SIZE} Tf {LEADING} TL 36 {PAGE_HEIGHT - 36} Td']
+        body += [f'{_pdf_string(line)} Tj T*' for line in page]
+        body.append('ET')
+        stream = '\n'.join(body).encode('latin-1', 'replace')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>'.encode()
+        )
+        kids.append(f'{len(objects)} 0 R')
+    objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'.encode()
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + obj + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def write_board(directory, board, pdf=True):
+    """Write one .txt (and .pdf) result sheet per institute; returns the paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, code, students in board:
+        lines = institute_lines(name, code, students)
+        base = os.path.join(directory, f'institute_{code}')
+        with open(base + '.txt', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        if pdf:
+            write_pdf(base + '.pdf', lines)
+        paths.append(base + ('.pdf' if pdf else '.txt'))
+    return paths
+
+
+def write_student_table(conn, board):
+    """Fill the web app's `student` table the way the deployed site has it."""
+    with conn:
+        conn.execute('DROP TABLE IF EXISTS student')
+        conn.execute('''
+            CREATE TABLE student (
+                id INTEGER PRIMARY KEY,
+                roll_no INTEGER,
+                name TEXT,
+                gpa REAL,
+                "group" TEXT,
+                institute TEXT,
+                sum INTEGER,
+                "createdAt" TEXT,
+                "updatedAt" TEXT
+            )
+        ''')
+        conn.executemany(
+            'INSERT INTO student (roll_no, name, gpa, "group", institute, sum, "createdAt", "updatedAt") '
+            "VALUES (?, ?, ?, ?, ?, ?, '2025-10-16', '2025-10-16')",
+            (
+                (int(s['roll']), s['name'], s['gpa'], s['group'], s['school_name'], sum(s['subjects'].values()))
+                for _, _, students in board for s in students
+            ),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic board result sheets.")
+    parser.add_argument('--students', type=int, default=10000,
+                        help="candidates on the board (a full board is around 100000)")
+    parser.add_argument('--per-institute', type=int, default=STUDENTS_PER_INSTITUTE)
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--out', default='bench_data', help="output directory (default: bench_data)")
+    parser.add_argument('--no-pdf', action='store_true', help="only write the .txt sheets")
+    args = parser.parse_args()
+    board = generate_board(args.students, args.per_institute, args.seed)
+    paths = write_board(args.out, board, pdf=not args.no_pdf)
+    print(f"✅ Wrote {len(paths)} institutes, {args.students} students to {args.out}/")
@@ -0,0 +1,207 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from urllib.parse import quote
+
+# Imported before run() changes directory: with '' on sys.path (python -c,
+# the REPL) these would no longer be found from inside the work directory.
+import app as web
+from bench.generate import STUDENTS_PER_INSTITUTE, generate_board, write_board, write_student_table
+from db import connect_for_ingest, ensure_ingest_schema, publish
+from parse_results1 import file_fingerprint, iter_pdf_lines, iter_students, replace_file_students
+
+PERCENTILES = (50, 95, 99)
+ROUTE_REQUESTS = 200
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of unsorted `samples`."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(name, samples, elapsed, units=None, unit='ops'):
+    """One report row: latency percentiles in ms and throughput per second.
+
+    `units` is how much work `samples` covered in total (students, lines...),
+    defaulting to the number of samples.
+    """
+    row = {'name': name, 'count': len(samples), 'elapsed_s': elapsed}
+    for p in PERCENTILES:
+        row[f'p{p}_ms'] = percentile(samples, p) * 1000
+    row['throughput'] = (units if units is not None else len(samples)) / elapsed if elapsed else 0.0
+    row['unit'] = f'{unit}/s'
+    return row
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def bench_extraction(paths):
+    """pdfminer text extraction, one sample per PDF; returns (row, lines per path)."""
+    lines, samples = {}, []
+    for path in paths:
+        lines[path], elapsed = timed(lambda p: list(iter_pdf_lines(p)), path)
+        samples.append(elapsed)
+    total_lines = sum(len(v) for v in lines.values())
+    return summarize('extract (pdfminer)', samples, sum(samples), total_lines, 'lines'), lines
+
+
+def bench_parsing(lines):
+    """parse the extracted lines, one sample per file; returns (row, students per path)."""
+    students, samples = {}, []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path, file_lines in lines.items():
+            students[path], elapsed = timed(lambda l: list(iter_students(l)), file_lines)
+            samples.append(elapsed)
+    total = sum(len(v) for v in students.values())
+    return summarize('parse', samples, sum(samples), total, 'students'), students
+
+
+def bench_load(db_file, students, board):
+    """Load every file into a fresh database, then publish it."""
+    conn = connect_for_ingest(db_file)
+    ensure_ingest_schema(conn)
+    samples = []
+    for path, file_students in students.items():
+        fingerprint = file_fingerprint(path)
+        _, elapsed = timed(replace_file_students, conn, path, fingerprint, file_students)
+        samples.append(elapsed)
+    total = sum(len(v) for v in students.values())
+    load = summarize('db load', samples, sum(samples), total, 'students')
+
+    write_student_table(conn, board)
+    _, elapsed = timed(publish, conn)
+    conn.close()
+    return [load, summarize('publish', [elapsed], elapsed, total, 'students')]
+
+
+def route_urls(conn, rng, requests):
+    """Request paths per hot route, sampled from the loaded data."""
+    rolls = [row[0] for row in conn.execute('SELECT roll_no FROM student')]
+    gpa5_rolls = [row[0] for row in conn.execute('SELECT roll_no FROM student WHERE gpa = 5.0')] or rolls
+    institutes = [row[0] for row in conn.execute('SELECT DISTINCT institute FROM student')]
+    per_page = 100
+    last_page = max(1, math.ceil(len(gpa5_rolls) / per_page))
+    groups = ['all', 'Science', 'Business Studies', 'Humanities']
+    return {
+        '/': ['/?' + f'group={quote(rng.choice(groups))}&page={rng.randint(1, 3)}' for _ in range(requests)],
+        '/ins/<school>': [f'/ins/{quote(rng.choice(institutes))}' for _ in range(requests)],
+        '/result/<roll>': [f'/result/{rng.choice(rolls)}' for _ in range(requests)],
+        'deep page': [f'/?page={rng.randint(max(1, last_page - 5), last_page)}' for _ in range(requests)],
+        'roll search': [f'/?roll={rng.choice(gpa5_rolls)}' for _ in range(requests)],
+    }
+
+
+# Routes that app.py never puts in the page cache: only timed uncached.
+UNCACHED_ROUTES = {'/result/<roll>'}
+
+
+def bench_routes(db_file, requests, seed):
+    """Hot routes through the Flask test client, with and without the page cache."""
+    client = web.app.test_client()
+    conn = sqlite3.connect(db_file)
+    urls = route_urls(conn, random.Random(seed), requests)
+    conn.close()
+
+    max_bytes = web.page_cache.max_bytes
+    rows = []
+    for cached in (False, True):
+        web.page_cache.max_bytes = max_bytes if cached else 0
+        for route, paths in urls.items():
+            if cached and route in UNCACHED_ROUTES:
+                continue
+            if cached:
+                for path in paths:
+                    client.get(path)
+            samples = []
+            for path in paths:
+                response, elapsed = timed(client.get, path)
+                if response.status_code != 200:
+                    raise RuntimeError(f'{path} returned {response.status_code}')
+                samples.append(elapsed)
+            label = f"{route} ({'page cache' if cached else 'uncached'})"
+            rows.append(summarize(label, samples, sum(samples), unit='req'))
+    web.page_cache.max_bytes = max_bytes
+    return rows
+
+
+def print_report(rows):
+    header = f"{'benchmark':<34}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'throughput':>22}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(
+            f"{row['name']:<34}{row['count']:>7}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            f"{row['p99_ms']:>10.2f}{row['throughput']:>14.1f} {row['unit']}"
+        )
+
+
+def run(students, per_institute=STUDENTS_PER_INSTITUTE, seed=2025, requests=ROUTE_REQUESTS,
+        pdf=True, workdir=None):
+    """Generate a board, push it through every stage and return the report rows.
+
+    Everything happens inside `workdir` (a temporary directory by default),
+    which becomes the working directory so results.db and the snapshot are
+    the app's defaults.
+    """
+    cleanup = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='boardresults-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        board, elapsed = timed(generate_board, students, per_institute, seed)
+        paths = write_board('pdfs', board, pdf=pdf)
+        rows = [summarize('generate', [elapsed], elapsed, students, 'students')]
+
+        if pdf:
+            row, lines = bench_extraction(paths)
+            rows.append(row)
+        else:
+            lines = {}
+            for path in paths:
+                with open(path) as f:
+                    lines[path] = f.read().splitlines()
+        row, parsed = bench_parsing(lines)
+        rows.append(row)
+
+        if os.path.exists('results.db'):
+            os.remove('results.db')
+        rows += bench_load('results.db', parsed, board)
+        rows += bench_routes('results.db', requests, seed)
+        return rows
+    finally:
+        os.chdir(previous)
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark extraction, parsing, loading and the web routes.")
+    parser.add_argument('--students', type=int, default=10000,
+                        help="candidates on the synthetic board (a full board is around 100000)")
+    parser.add_argument('--per-institute', type=int, default=STUDENTS_PER_INSTITUTE)
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--requests', type=int, default=ROUTE_REQUESTS, help="requests per route")
+    parser.add_argument('--no-pdf', action='store_true',
+                        help="skip PDF generation and extraction, parse the text sheets")
+    parser.add_argument('--workdir', default=None, help="keep the generated data here instead of a temp dir")
+    parser.add_argument('--json', default=None, help="also write the report rows to this file")
+    args = parser.parse_args()
+    rows = run(args.students, args.per_institute, args.seed, args.requests, not args.no_pdf, args.workdir)
+    print_report(rows)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,601 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import statistics
+import threading
+import time
+from pathlib import Path
+
+import metrics
+from snapshot import SNAPSHOT_DIR, write_snapshot
+
+DB_FILE = 'results.db'
+
+
+subject_id_name_map = {
+    '101': 'Bangla',
+    '107': 'English',
+    '108': 'English 2nd Paper',
+    '154': 'Information & Communication Technology',
+    '126' : 'Higer Mathematics',
+    '152': 'Finance and Banking',
+    '143': 'Business Entrepreneurship',
+    '147': 'Physical Education, Health, and Sports',
+    '153': 'History of Bangladesh and World Civilization',
+    '134': 'Agriculture Studies ',
+    '111': 'Islam and Moral Education',
+    '112': 'Hindu and Moral Education',
+    '127': 'Science',
+    '150': 'Bangladesh and Global Studies',
+    '156': 'Career Education',
+    '110': 'Geography and Environment (Old)',
+    '109': 'Mathematics',
+    '136' : 'Physics',
+    '138' : 'Biology',
+    '137' : 'Chemistry',
+    '146' : 'Accounting',
+    '151' :'Home Science',
+    '153' :'HISTORY OF BANGLADESH AND WORLD CIVILIZATION',
+    '140' : 'CIVICS AND CITIZENSHIP',
+    '110' :'GEOGRAPHY AND ENVIRONMENT'
+}
+
+# Ingestion schema: one row per student plus one row per (student, subject).
+# Marks are stored as integers so per-subject queries and totals are indexable.
+INGEST_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS students (
+        roll TEXT PRIMARY KEY,
+        gpa REAL,
+        group_name TEXT,
+        school_name TEXT,
+        board TEXT,
+        source_file TEXT
+    );
+    CREATE TABLE IF NOT EXISTS subjects (
+        code TEXT PRIMARY KEY,
+        name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS marks (
+        roll TEXT NOT NULL,
+        subject_code TEXT NOT NULL,
+        marks INTEGER,
+        PRIMARY KEY (roll, subject_code)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_marks_subject ON marks (subject_code, marks);
+    CREATE TABLE IF NOT EXISTS ingest_manifest (
+        path TEXT PRIMARY KEY,
+        sha256 TEXT NOT NULL,
+        mtime REAL NOT NULL,
+        size INTEGER NOT NULL,
+        students INTEGER NOT NULL,
+        loaded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+# Indexes backing the leaderboard queries in queries.py. The group column is
+# indexed NOCASE because the group filter has always been case-insensitive.
+# Each ends in the leaderboard order (sum DESC, roll_no), so a page, or a
+# keyset cursor, is read straight off the index with no sort.
+STUDENT_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_student_gpa_sum_roll ON student (gpa, sum DESC, roll_no)',
+    'CREATE INDEX IF NOT EXISTS idx_student_gpa_group_sum_roll '
+    'ON student (gpa, "group" COLLATE NOCASE, sum DESC, roll_no)',
+    'CREATE INDEX IF NOT EXISTS idx_student_institute_sum_roll ON student (institute, sum DESC, roll_no)',
+    'CREATE INDEX IF NOT EXISTS idx_student_institute_group_sum_roll '
+    'ON student (institute, "group" COLLATE NOCASE, sum DESC, roll_no)',
+    'CREATE INDEX IF NOT EXISTS idx_student_roll_no ON student (roll_no)',
+)
+# Older indexes the ones above replace.
+SUPERSEDED_INDEXES = ('idx_student_gpa_sum', 'idx_student_gpa_group_sum', 'idx_student_institute_group_sum')
+
+# Materialized ranks, one row per student, rebuilt after every ingest so that a
+# roll lookup never has to rank the cohort. student_id is the student rowid.
+#   overall_rank / group_rank: merit order (GPA, then total marks) over every
+#     student, which for GPA-5 students is exactly their leaderboard position
+#   institute_rank / institute_group_rank: total marks within the institute
+#   board_rank: merit order within the student's education board
+STUDENT_RANK_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS student_rank (
+        student_id INTEGER PRIMARY KEY,
+        roll_no,
+        overall_rank INTEGER,
+        group_rank INTEGER,
+        institute_rank INTEGER,
+        institute_group_rank INTEGER,
+        board_rank INTEGER
+    )
+"""
+
+RANK_COLUMNS = (
+    'overall_rank', 'group_rank', 'institute_rank', 'institute_group_rank', 'board_rank',
+)
+
+# Summary statistics per cohort, so the stats pages never touch student rows.
+#   scope 'group': the whole board (name ''), per group
+#   scope 'institute' / 'board': name is the institute / education board
+#   scope 'subject': name is the subject code and the values are its marks
+# group_name is the lower-cased group, or 'all' for the whole cohort. A row is
+# only recomputed when its signature (count and moments of the values) changes.
+STATS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cohort_stats (
+        scope TEXT NOT NULL,
+        name TEXT NOT NULL,
+        group_name TEXT NOT NULL,
+        signature TEXT NOT NULL,
+        candidates INTEGER NOT NULL,
+        gpa5 INTEGER NOT NULL,
+        passed INTEGER NOT NULL,
+        mean_total REAL,
+        median_total REAL,
+        p10 REAL,
+        p25 REAL,
+        p75 REAL,
+        p90 REAL,
+        p99 REAL,
+        top_total REAL,
+        PRIMARY KEY (scope, name, group_name)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_cohort_stats_gpa5 ON cohort_stats (scope, group_name, gpa5);
+"""
+
+STATS_PERCENTILES = (10, 25, 75, 90, 99)
+PASS_MARK = 33
+
+# Full-text indexes for the search page and autocomplete. student_search is an
+# external-content index over `student` (it stores only the index, the names
+# are read back from student by rowid); institute_search holds one row per
+# institute. Prefix indexes make the "typed so far*" queries cheap.
+SEARCH_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS student_search USING fts5 (
+        name, institute, roll_no UNINDEXED,
+        content = 'student', content_rowid = 'rowid',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS institute_search USING fts5 (
+        institute, candidates UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+    );
+"""
+
+# Ingestion is a bulk load: WAL keeps the site readable while it runs, and
+# synchronous=NORMAL only fsyncs at checkpoints instead of on every commit.
+INGEST_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -65536',
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+def connect_for_ingest(path=DB_FILE):
+    """Open a write connection tuned for bulk loading."""
+    conn = sqlite3.connect(path, cached_statements=256)
+    for pragma in INGEST_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# Small key/value table; `version` is bumped on every publish.
+META_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS db_meta (
+        key TEXT PRIMARY KEY,
+        value
+    )
+"""
+
+# Web workers only read. mmap lets hot pages be served straight from the OS
+# page cache; query_only guards against accidental writes.
+READ_PRAGMAS = (
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -32768',
+    'PRAGMA query_only = ON',
+)
+
+# Set on deployments where nothing writes the database while it is served
+# (e.g. the copy bundled with the Vercel function): SQLite can then skip
+# locking and change detection entirely.
+IMMUTABLE = os.environ.get('RESULTS_DB_IMMUTABLE') == '1'
+
+_local = threading.local()
+# Rows fetched at a time when a TimedCursor is iterated.
+ITER_BATCH = 256
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports statement and fetch times and row counts to metrics."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.record_sql(time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        metrics.record_fetch(time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        metrics.record_fetch(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        metrics.record_fetch(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __iter__(self):
+        # Rows are read in batches so only the time spent in SQLite is timed,
+        # without a clock read per row; reported once, when iteration ends.
+        seconds, rows = 0.0, 0
+        try:
+            while True:
+                started = time.perf_counter()
+                batch = super().fetchmany(ITER_BATCH)
+                seconds += time.perf_counter() - started
+                if not batch:
+                    return
+                rows += len(batch)
+                yield from batch
+        finally:
+            metrics.record_fetch(seconds, rows)
+
+
+class ReadConnection(sqlite3.Connection):
+    """Read-only connection that remembers which tables exist.
+
+    The table list is reloaded only when SQLite's schema_version changes, so
+    an ingest that adds tables is still picked up without a restart.
+    """
+
+    _schema_version = None
+    _tables = frozenset()
+
+    def execute(self, sql, parameters=()):
+        return self.cursor(TimedCursor).execute(sql, parameters)
+
+    def tables(self):
+        version = self.execute('PRAGMA schema_version').fetchone()[0]
+        if version != self._schema_version:
+            self._tables = frozenset(
+                row[0] for row in self.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            )
+            self._schema_version = version
+        return self._tables
+
+
+def read_connection(path=DB_FILE, immutable=IMMUTABLE):
+    """The calling thread's read-only connection to `path`, opened on first use.
+
+    Connections are per thread and per process: a worker forked after the
+    parent opened one (gunicorn --preload) opens its own instead of sharing
+    the parent's file handle. A file that has been replaced since it was
+    opened (a shard swapped in by a rebuild) is opened again.
+    """
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.conns, _local.pid = {}, os.getpid()
+    inode = os.stat(path).st_ino
+    conn, opened_inode = _local.conns.get(path, (None, None))
+    if conn is None or opened_inode != inode:
+        if conn is not None:
+            conn.close()
+        uri = Path(path).resolve().as_uri() + '?mode=ro'
+        if immutable:
+            uri += '&immutable=1'
+        conn = sqlite3.connect(uri, uri=True, factory=ReadConnection, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in READ_PRAGMAS:
+            conn.execute(pragma)
+        conn.tables()
+        _local.conns[path] = (conn, inode)
+    return conn
+
+
+def table_exists(conn, name):
+    if isinstance(conn, ReadConnection):
+        return name in conn.tables()
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def ensure_ingest_schema(conn):
+    """Create the ingestion tables, seed `subjects` and migrate old data."""
+    conn.executescript(INGEST_SCHEMA)
+    # Databases from before the ingest manifest have no source_file column.
+    if 'source_file' not in {row[1] for row in conn.execute('PRAGMA table_info(students)')}:
+        conn.execute('ALTER TABLE students ADD COLUMN source_file TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_students_source_file ON students (source_file)')
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO subjects (code, name) VALUES (?, ?)',
+            subject_id_name_map.items(),
+        )
+    migrate_wide_marks(conn)
+
+
+def migrate_wide_marks(conn):
+    """Move marks out of the old per-subject `"<code>_marks"` columns.
+
+    Older databases grew one TEXT column on `students` per subject code. Their
+    values are copied into `marks` and the columns dropped, so the migration
+    runs once. SQLite older than 3.35 cannot drop columns; they are left in
+    place and ignored.
+    """
+    wide_columns = [
+        row[1] for row in conn.execute('PRAGMA table_info(students)')
+        if re.fullmatch(r'\d+_marks', row[1])
+    ]
+    with conn:
+        for col in wide_columns:
+            conn.execute(f"""
+                INSERT OR IGNORE INTO marks (roll, subject_code, marks)
+                SELECT roll, ?, CAST("{col}" AS INTEGER) FROM students
+                WHERE "{col}" IS NOT NULL AND "{col}" != ''
+            """, (col[:-len('_marks')],))
+    for col in wide_columns:
+        try:
+            conn.execute(f'ALTER TABLE students DROP COLUMN "{col}"')
+        except sqlite3.OperationalError:
+            break
+    conn.commit()
+
+
+def ensure_indexes(conn):
+    """Create the indexes the web layer needs on the `student` table."""
+    if not table_exists(conn, 'student'):
+        return
+    for name in SUPERSEDED_INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+    for sql in STUDENT_INDEXES:
+        conn.execute(sql)
+    conn.execute('ANALYZE student')
+    conn.commit()
+
+
+def sync_student(conn):
+    """Copy re-ingested GPA, group, institute and total marks into `student`.
+
+    `student` (with the names) is loaded from outside this repo; ingest only
+    writes `students` and `marks`. Only rows whose ingested values differ are
+    rewritten, so a corrected PDF moves ranks, stats and search. Rolls that
+    are only in `students` are not added (the PDFs carry no names; `student`
+    has to be reloaded for those). Rows of a removed PDF are deleted with
+    it, see parse_results1._delete_file_students. Returns the number of rows
+    updated.
+    """
+    if not (table_exists(conn, 'student') and table_exists(conn, 'students')):
+        return 0
+    with conn:
+        return conn.execute("""
+            UPDATE student SET
+                gpa = i.gpa,
+                "group" = COALESCE(i.grp, student."group"),
+                institute = COALESCE(i.institute, student.institute),
+                sum = COALESCE(i.total, student.sum)
+            FROM (
+                SELECT s.roll, s.gpa, s.group_name AS grp, NULLIF(s.school_name, '') AS institute,
+                       (SELECT sum(m.marks) FROM marks m WHERE m.roll = s.roll) AS total
+                FROM students s
+            ) i
+            WHERE i.roll = CAST(student.roll_no AS TEXT)
+              AND (student.gpa, student."group", student.institute, student.sum)
+                  IS NOT (i.gpa, COALESCE(i.grp, student."group"),
+                          COALESCE(i.institute, student.institute), COALESCE(i.total, student.sum))
+        """).rowcount
+
+
+def rebuild_ranks(conn):
+    """Recompute the student_rank table from `student` in one transaction."""
+    if not table_exists(conn, 'student'):
+        return
+    # The board is only known to the ingestion table.
+    if table_exists(conn, 'students'):
+        board_join = 'LEFT JOIN students b ON b.roll = CAST(st.roll_no AS TEXT)'
+        board = "COALESCE(b.board, '')"
+    else:
+        board_join, board = '', "''"
+
+    with conn:
+        conn.execute(STUDENT_RANK_SCHEMA)
+        conn.execute('DELETE FROM student_rank')
+        conn.execute(f"""
+            INSERT INTO student_rank (student_id, roll_no, {', '.join(RANK_COLUMNS)})
+            SELECT
+                st.rowid,
+                st.roll_no,
+                ROW_NUMBER() OVER (ORDER BY st.gpa DESC, st.sum DESC, st.roll_no),
+                ROW_NUMBER() OVER (PARTITION BY lower(st."group")
+                                   ORDER BY st.gpa DESC, st.sum DESC, st.roll_no),
+                ROW_NUMBER() OVER (PARTITION BY st.institute
+                                   ORDER BY st.sum DESC, st.roll_no),
+                ROW_NUMBER() OVER (PARTITION BY st.institute, lower(st."group")
+                                   ORDER BY st.sum DESC, st.roll_no),
+                ROW_NUMBER() OVER (PARTITION BY {board}
+                                   ORDER BY st.gpa DESC, st.sum DESC, st.roll_no)
+            FROM student st {board_join}
+        """)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_student_rank_roll_no ON student_rank (roll_no)')
+
+
+def _stats_sources(conn):
+    """(scope, SELECT of name, group, value, gpa, pass condition) per stats scope."""
+    group = 'COALESCE(lower(st."group"), \'\')'
+    sources = [
+        ('group', f"SELECT '', {group}, st.sum, st.gpa FROM student st", 'gpa > 0'),
+        ('institute', f"SELECT COALESCE(st.institute, ''), {group}, st.sum, st.gpa FROM student st",
+         'gpa > 0'),
+    ]
+    if table_exists(conn, 'students'):
+        sources.append((
+            'board',
+            f"""SELECT COALESCE(b.board, ''), {group}, st.sum, st.gpa FROM student st
+                LEFT JOIN students b ON b.roll = CAST(st.roll_no AS TEXT)""",
+            'gpa > 0',
+        ))
+    if table_exists(conn, 'marks'):
+        sources.append((
+            'subject',
+            # CROSS JOIN keeps student as the outer loop, probing marks by its key.
+            f"""SELECT m.subject_code, {group}, m.marks, st.gpa FROM student st
+                CROSS JOIN marks m ON m.roll = CAST(st.roll_no AS TEXT)""",
+            f'value >= {PASS_MARK}',
+        ))
+    return sources
+
+
+def _percentile(values, p):
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def rebuild_stats(conn):
+    """Bring cohort_stats up to date with `student`; returns rows recomputed.
+
+    One aggregate pass per scope yields every cohort's signature; only the
+    cohorts whose signature changed have their values read back, in one
+    ordered pass per scope, to recompute medians and percentiles. Re-ingesting
+    one institute rewrites that institute's rows plus the board-wide rows it
+    belongs to.
+    """
+    if not table_exists(conn, 'student'):
+        return 0
+    signature = (
+        "count(value) || ':' || total(value) || ':' || total(value * value) || ':' "
+        "|| total(gpa) || ':' || ifnull(min(value), '') || ':' || ifnull(max(value), '')"
+    )
+    changed = 0
+    with conn:
+        conn.executescript(STATS_SCHEMA)
+        stored = {
+            (scope, name, group): sig
+            for scope, name, group, sig in conn.execute(
+                'SELECT scope, name, group_name, signature FROM cohort_stats'
+            )
+        }
+        seen = set()
+        for scope, source, passed in _stats_sources(conn):
+            src = f'WITH src (name, grp, value, gpa) AS ({source})'
+            cohorts = conn.execute(f"""
+                {src}
+                SELECT name, grp, {signature}, count(*), count(*) FILTER (WHERE gpa = 5.0),
+                       count(*) FILTER (WHERE {passed})
+                FROM src GROUP BY name, grp
+                UNION ALL
+                SELECT name, 'all', {signature}, count(*), count(*) FILTER (WHERE gpa = 5.0),
+                       count(*) FILTER (WHERE {passed})
+                FROM src GROUP BY name
+            """).fetchall()
+            stale = {}
+            for name, group, sig, *counts in cohorts:
+                key = (scope, name, group)
+                seen.add(key)
+                if stored.get(key) != sig:
+                    stale[name, group] = (sig, *counts)
+            if not stale:
+                continue
+
+            # One ordered pass over the cohorts that changed.
+            values = {key: [] for key in stale}
+            for name, group, value in conn.execute(
+                f"""{src} SELECT name, grp, value FROM src
+                    WHERE value IS NOT NULL AND name IN (SELECT value FROM json_each(?))
+                    ORDER BY value""",
+                (json.dumps(sorted({name for name, _ in stale})),),
+            ):
+                for key in ((name, group), (name, 'all')):
+                    if key in values:
+                        values[key].append(value)
+
+            for (name, group), (sig, candidates, gpa5, passed_count) in stale.items():
+                cohort = values[name, group]
+                summary = [None] * (3 + len(STATS_PERCENTILES))
+                if cohort:
+                    summary = [
+                        statistics.fmean(cohort),
+                        statistics.median(cohort),
+                        *(_percentile(cohort, p) for p in STATS_PERCENTILES),
+                        cohort[-1],
+                    ]
+                conn.execute(
+                    'INSERT OR REPLACE INTO cohort_stats VALUES (?, ?, ?, ?, ?, ?, ?, '
+                    + ', '.join('?' * len(summary)) + ')',
+                    (scope, name, group, sig, candidates, gpa5, passed_count, *summary),
+                )
+            changed += len(stale)
+        conn.executemany(
+            'DELETE FROM cohort_stats WHERE scope = ? AND name = ? AND group_name = ?',
+            stored.keys() - seen,
+        )
+    return changed
+
+
+def rebuild_search(conn):
+    """Re-index student and institute names for full-text search."""
+    if not table_exists(conn, 'student'):
+        return
+    with conn:
+        conn.executescript(SEARCH_SCHEMA)
+        conn.execute("INSERT INTO student_search (student_search) VALUES ('rebuild')")
+        conn.execute('DELETE FROM institute_search')
+        conn.execute("""
+            INSERT INTO institute_search (institute, candidates)
+            SELECT institute, count(*) FROM student
+            WHERE institute IS NOT NULL AND institute != ''
+            GROUP BY institute
+        """)
+        conn.execute("INSERT INTO institute_search (institute_search) VALUES ('optimize')")
+
+
+def bump_version(conn):
+    """Mark the data as changed; the web layer keys its caches on this."""
+    with conn:
+        conn.execute(META_SCHEMA)
+        conn.execute("""
+            INSERT INTO db_meta (key, value) VALUES ('version', 1)
+            ON CONFLICT (key) DO UPDATE SET value = value + 1
+        """)
+        conn.execute(
+            "INSERT OR REPLACE INTO db_meta (key, value) VALUES ('updated_at', ?)",
+            (time.time(),),
+        )
+
+
+def read_version(conn):
+    """(version, updated_at unix time) of the data, (0, None) if never published."""
+    if not table_exists(conn, 'db_meta'):
+        return 0, None
+    meta = dict(conn.execute("SELECT key, value FROM db_meta"))
+    return int(meta.get('version', 0)), meta.get('updated_at')
+
+
+def publish(conn, snapshot_dir=SNAPSHOT_DIR):
+    """Rebuild what the web layer derives from the data and bump the version.
+
+    Everything is derived from the web `student` table, which is first
+    brought up to date with the ingested rows (see sync_student).
+    `snapshot_dir=None` skips the NumPy snapshot (shards are served from
+    SQLite only).
+    """
+    sync_student(conn)
+    ensure_indexes(conn)
+    rebuild_ranks(conn)
+    rebuild_stats(conn)
+    rebuild_search(conn)
+    bump_version(conn)
+    if snapshot_dir is not None:
+        write_snapshot(conn, read_version(conn)[0], snapshot_dir)
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(DB_FILE)
+    publish(conn)
+    conn.close()
+    print("✅ Indexes, ranks, stats and search ready.")
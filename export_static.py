@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+from urllib.parse import quote, urlencode
+
+import queries
+from app import app
+from db import read_connection
+
+OUT_DIR = 'public'
+PAGES_DIR = '_pages'
+MANIFEST_FILE = 'manifest.json'
+TEMPLATES = ('students.html', 'student_result.html')
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _template_digest():
+    """Changing a template invalidates every exported page."""
+    digest = hashlib.sha1()
+    for name in TEMPLATES:
+        with open(os.path.join(app.root_path, app.template_folder, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def leaderboard_pages(conn, institute=None, groups=None):
+    """Yield (url, file, fingerprint) for every page of a leaderboard.
+
+    `groups` defaults to the groups in the leaderboard's cohort; a group
+    without students gets the empty first page the app renders for it.
+    The fingerprint covers exactly what the page shows: its rows and the
+    page count the pagination links depend on.
+    """
+    base = '/' if institute is None else f'/ins/{quote(institute)}'
+    folder = 'board' if institute is None else os.path.join('ins', institute)
+    for group in groups or ['all'] + queries.leaderboard_groups(conn, institute):
+        page = total_pages = 1
+        while page <= total_pages:
+            students, page, total_pages = queries.leaderboard_page(conn, group, institute, page)
+            url = f"{base}?{urlencode({'group': group, 'page': page, 'roll': ''})}"
+            file = os.path.join(PAGES_DIR, folder, group, f'{page}.html')
+            yield url, file, _digest(students, total_pages)
+            page += 1
+
+
+def result_pages(conn):
+    """Yield (url, file, fingerprint) for every /result/<roll> page."""
+    marks = dict(conn.execute(
+        "SELECT roll, group_concat(subject_code || ':' || marks) FROM marks GROUP BY roll"
+    )) if 'marks' in conn.tables() else {}
+    ranks = 'student_rank' in conn.tables()
+    rows = conn.execute(
+        'SELECT student.*' + (', r.*' if ranks else '') + ' FROM student'
+        + (' LEFT JOIN student_rank r ON r.student_id = student.rowid' if ranks else '')
+    )
+    for row in rows:
+        roll = row['roll_no']
+        yield f'/result/{roll}', os.path.join('result', f'{roll}.html'), _digest(
+            tuple(row), marks.get(str(roll))
+        )
+
+
+def write_roll_index(conn, out_dir):
+    """Per-roll JSON shards (by the first three digits) for the search box."""
+    shards = {}
+    for roll, name, group, gpa, institute, total in conn.execute(
+        'SELECT roll_no, name, "group", gpa, institute, sum FROM student'
+    ):
+        shards.setdefault(str(roll)[:3], {})[str(roll)] = [name, group, gpa, institute, total]
+    folder = os.path.join(out_dir, PAGES_DIR, 'rolls')
+    os.makedirs(folder, exist_ok=True)
+    for prefix, entries in shards.items():
+        with open(os.path.join(folder, f'{prefix}.json'), 'w') as f:
+            json.dump(entries, f, separators=(',', ':'))
+
+
+def _alternatives(name, values):
+    """Anchored regex capturing `name` for exactly one of `values`."""
+    escaped = (re.sub(r'([.*+?^${}()|\[\]\\])', r'\\\1', v) for v in values)
+    return f'^(?<{name}>' + '|'.join(escaped) + ')$'
+
+
+def _page_pattern(pages):
+    """Anchored regex capturing `page` for exactly the numbers 1..pages."""
+    last = str(pages)
+    options = []
+    if len(last) > 1:
+        # Every number with fewer digits than the last page.
+        options.append('[1-9]' + (f'\\d{{0,{len(last) - 2}}}' if len(last) > 2 else ''))
+    for i, digit in enumerate(last):
+        # Same length, below the last page from digit i on.
+        low = 1 if i == 0 else 0
+        if int(digit) > low:
+            options.append(last[:i] + f'[{low}-{int(digit) - 1}]' + '\\d' * (len(last) - i - 1))
+    options.append(last)
+    return '^(?<page>' + '|'.join(options) + ')$'
+
+
+def vercel_rewrites(board_pages, groups):
+    """Rewrites serving the exported leaderboards at their dynamic URLs.
+
+    A rule only ever points at a page that was exported: the board's pages
+    of each group, and the first page of every group of every institute
+    (deeper institute pages are rare and left to the app). Anything else,
+    like a page past the last one, page=0 or a group typed in another case,
+    falls through to the Python function, as does a roll search.
+    /result/<roll> needs no rule: with cleanUrls the file system answers it.
+    """
+    roll_search = {'type': 'query', 'key': 'roll', 'value': '.+'}
+    no_page = {'type': 'query', 'key': 'page'}
+    no_group = {'type': 'query', 'key': 'group'}
+
+    def page_rules(source, folder, group, page, default_group='all'):
+        group_query = [{'type': 'query', 'key': 'group', 'value': group}] if group else []
+        folder_group = ':group' if group else default_group
+        return [
+            {'source': source,
+             'has': group_query + [{'type': 'query', 'key': 'page', 'value': page}],
+             'missing': [roll_search] + ([] if group else [no_group]),
+             'destination': f'/{PAGES_DIR}/{folder}/{folder_group}/:page.html'},
+            {'source': source,
+             'has': group_query,
+             'missing': [roll_search, no_page] + ([] if group else [no_group]),
+             'destination': f'/{PAGES_DIR}/{folder}/{folder_group}/1.html'},
+        ]
+
+    rules = []
+    for group, pages in board_pages.items():
+        rules += page_rules('/', 'board', _alternatives('group', [group]), _page_pattern(pages))
+    rules += page_rules('/', 'board', None, _page_pattern(board_pages.get('all', 1)))
+    rules += page_rules('/ins/:school', 'ins/:school', _alternatives('group', groups), _page_pattern(1))
+    rules += page_rules('/ins/:school', 'ins/:school', None, _page_pattern(1))
+    for rule in rules:
+        if not rule['has']:
+            del rule['has']
+    return rules
+
+
+def write_vercel_config(board_pages, groups, path='vercel.json'):
+    with open(path) as f:
+        config = json.load(f)
+    dynamic = [rule for rule in config.get('rewrites', []) if not rule['destination'].startswith(f'/{PAGES_DIR}/')]
+    config['cleanUrls'] = True
+    config['rewrites'] = vercel_rewrites(board_pages, groups) + dynamic
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+        f.write('\n')
+
+
+def export(out_dir=OUT_DIR, full=False):
+    """Render every leaderboard, institute and result page to `out_dir`.
+
+    Only pages whose fingerprint changed since the last export are rendered
+    again, so re-ingesting one institute rewrites that institute's pages,
+    the result pages of its students and whichever board pages moved.
+    Pages that no longer exist are deleted. Returns ({board group: pages},
+    every group value), for the rewrites.
+    """
+    conn = read_connection()
+    manifest_path = os.path.join(out_dir, PAGES_DIR, MANIFEST_FILE)
+    previous = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    templates = _template_digest()
+    if previous.get('templates') != templates:
+        previous = {}
+
+    groups = ['all'] + [row[0] for row in conn.execute(
+        'SELECT DISTINCT "group" FROM student WHERE "group" IS NOT NULL ORDER BY 1'
+    )]
+    board_pages = {}
+
+    def all_pages():
+        for url, file, fingerprint in leaderboard_pages(conn):
+            group = os.path.basename(os.path.dirname(file))
+            board_pages[group] = board_pages.get(group, 0) + 1
+            yield url, file, fingerprint
+        for institute in queries.institutes(conn):
+            yield from leaderboard_pages(conn, institute, groups)
+        yield from result_pages(conn)
+
+    app.config['STATIC_EXPORT'] = True
+    client = app.test_client()
+    pages = {}
+    rendered = 0
+    for url, file, fingerprint in all_pages():
+        pages[file] = fingerprint
+        path = os.path.join(out_dir, file)
+        if previous.get('pages', {}).get(file) == fingerprint and os.path.exists(path):
+            continue
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} returned {response.status_code}')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(response.data)
+        rendered += 1
+
+    removed = set(previous.get('pages', {})) - set(pages)
+    for file in removed:
+        try:
+            os.remove(os.path.join(out_dir, file))
+        except FileNotFoundError:
+            pass
+
+    write_roll_index(conn, out_dir)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump({'templates': templates, 'pages': pages}, f)
+    print(f"✅ Exported {len(pages)} pages to {out_dir}/: {rendered} rendered, "
+          f"{len(pages) - rendered} unchanged, {len(removed)} removed")
+    return board_pages, groups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render the site to static HTML for the CDN.")
+    parser.add_argument('--out', default=OUT_DIR, help="output directory (default: public)")
+    parser.add_argument('--full', action='store_true', help="ignore the previous export and render everything")
+    parser.add_argument('--vercel', action='store_true',
+                        help="add rewrites serving the exported pages to vercel.json")
+    args = parser.parse_args()
+    board_pages, groups = export(args.out, args.full)
+    if args.vercel:
+        write_vercel_config(board_pages, groups)
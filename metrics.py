@@ -0,0 +1,295 @@
+import bisect
+import os
+import threading
+import time
+
+from flask import before_render_template, g, request, template_rendered
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow pages.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Per-file ingest stages take seconds, not milliseconds.
+INGEST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+PHASES = ('query', 'process', 'render')
+# Ingest runs in its own process; it leaves its metrics in this file (the
+# node_exporter "textfile" format) and /metrics serves them with its own.
+INGEST_METRICS_FILE = os.environ.get('INGEST_METRICS_FILE', 'ingest_metrics.prom')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.type = 'counter'
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name + _labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    """A value set from outside, or read from `func` at scrape time."""
+
+    def __init__(self, name, help, labelnames=(), func=None, type='gauge'):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.func = func
+
+    def set(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.func is not None:
+            yield self.name, self.func()
+            return
+        yield from super().samples()
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.type = 'histogram'
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield self.name + '_bucket' + _labels(self.labelnames, key, [('le', bound)]), cumulative
+            yield self.name + '_sum' + _labels(self.labelnames, key), counts[-1]
+            yield self.name + '_count' + _labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(f'{sample} {value}' for sample, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path=INGEST_METRICS_FILE):
+        """Write render() to `path`, replacing the old file atomically."""
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.render())
+        os.replace(path + '.tmp', path)
+
+
+# Web metrics -----------------------------------------------------------------
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.add(Histogram(
+    'boardresults_request_seconds', 'Request latency by route and status.', ('route', 'status'),
+))
+PHASE_SECONDS = REGISTRY.add(Histogram(
+    'boardresults_request_phase_seconds',
+    'Request time spent in SQLite (query), in Jinja (render) and elsewhere (process).',
+    ('route', 'phase'),
+))
+SQL_SECONDS = REGISTRY.add(Histogram(
+    'boardresults_sql_query_seconds', 'Time to execute one SQL statement, by route.', ('route',),
+))
+SQL_ROWS = REGISTRY.add(Counter(
+    'boardresults_sql_rows_total', 'Rows fetched from SQLite, by route.', ('route',),
+))
+
+_local = threading.local()
+
+
+def _route():
+    return getattr(_local, 'route', 'none')
+
+
+def record_sql(seconds):
+    """Called by db.TimedCursor for every statement executed."""
+    SQL_SECONDS.observe(seconds, route=_route())
+    _local.sql_seconds = getattr(_local, 'sql_seconds', 0.0) + seconds
+
+
+def record_fetch(seconds, rows):
+    """Called by db.TimedCursor for every fetch; flushed once per request."""
+    _local.sql_seconds = getattr(_local, 'sql_seconds', 0.0) + seconds
+    _local.sql_rows = getattr(_local, 'sql_rows', 0) + rows
+
+
+def _start_request():
+    _local.route = request.url_rule.rule if request.url_rule else 'unmatched'
+    _local.sql_seconds, _local.sql_rows, _local.render_seconds = 0.0, 0, 0.0
+    g.metrics_started = time.perf_counter()
+
+
+def _template_started(sender, **extra):
+    _local.render_started = time.perf_counter()
+
+
+def _template_finished(sender, **extra):
+    started = getattr(_local, 'render_started', None)
+    if started is not None:
+        _local.render_seconds = getattr(_local, 'render_seconds', 0.0) + time.perf_counter() - started
+        _local.render_started = None
+
+
+def init_app(app, page_cache=None, slow_request_ms=None):
+    """Time every request of `app` and serve /metrics.
+
+    A streamed response (the bulk export) is timed until its last chunk has
+    been sent, and the SQL it runs while streaming counts towards its route.
+    With `slow_request_ms` (or SLOW_REQUEST_MS in the environment), requests
+    slower than that are logged with their phase breakdown.
+    """
+    if slow_request_ms is None and os.environ.get('SLOW_REQUEST_MS'):
+        slow_request_ms = float(os.environ['SLOW_REQUEST_MS'])
+
+    if page_cache is not None:
+        REGISTRY.add(Gauge('boardresults_page_cache_hits_total', 'Page cache hits.',
+                           func=lambda: page_cache.hits, type='counter'))
+        REGISTRY.add(Gauge('boardresults_page_cache_misses_total', 'Page cache misses.',
+                           func=lambda: page_cache.misses, type='counter'))
+        REGISTRY.add(Gauge('boardresults_page_cache_hit_ratio', 'Page cache hits / lookups.',
+                           func=lambda: page_cache.hits / max(1, page_cache.hits + page_cache.misses)))
+        REGISTRY.add(Gauge('boardresults_page_cache_bytes', 'Bytes of rendered pages cached.',
+                           func=lambda: page_cache.size))
+
+    before_render_template.connect(_template_started, app, weak=False)
+    template_rendered.connect(_template_finished, app, weak=False)
+    app.before_request(_start_request)
+
+    def record(route, status, started, method, path):
+        total = time.perf_counter() - started
+        query, render = _local.sql_seconds, _local.render_seconds
+        phases = {'query': query, 'render': render, 'process': max(0.0, total - query - render)}
+        REQUEST_SECONDS.observe(total, route=route, status=status)
+        for phase in PHASES:
+            PHASE_SECONDS.observe(phases[phase], route=route, phase=phase)
+        SQL_ROWS.inc(_local.sql_rows, route=route)
+        if slow_request_ms is not None and total * 1000 >= slow_request_ms:
+            app.logger.warning(
+                '🐢 Slow request %s %s: %.1f ms (query %.1f, process %.1f, render %.1f ms, %d rows)',
+                method, path, total * 1000,
+                query * 1000, phases['process'] * 1000, render * 1000, _local.sql_rows,
+            )
+        _local.route = 'none'
+
+    def timed_stream(body, *args):
+        # Runs after the request has returned, in the thread sending the
+        # response: the route is set again so the stream's SQL is its own.
+        _local.route = args[0]
+        try:
+            yield from body
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            record(*args)
+
+    @app.after_request
+    def _finish_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        args = (_route(), response.status_code, started, request.method, request.full_path.rstrip('?'))
+        if response.is_streamed:
+            response.response = timed_stream(response.response, *args)
+        else:
+            record(*args)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        body = REGISTRY.render()
+        if os.path.exists(INGEST_METRICS_FILE):
+            with open(INGEST_METRICS_FILE) as f:
+                body += f.read()
+        return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+# Ingest metrics --------------------------------------------------------------
+
+class IngestMetrics:
+    """Per-file ingest timings, written to INGEST_METRICS_FILE after each load."""
+
+    def __init__(self):
+        self.registry = Registry()
+        self.extract = self.registry.add(Histogram(
+            'boardresults_ingest_extract_seconds', 'pdfminer text extraction time per PDF.',
+            buckets=INGEST_BUCKETS,
+        ))
+        self.parse = self.registry.add(Histogram(
+            'boardresults_ingest_parse_seconds', 'Student parsing time per PDF.', buckets=INGEST_BUCKETS,
+        ))
+        self.write = self.registry.add(Histogram(
+            'boardresults_ingest_write_seconds', 'Time to replace one PDF\'s rows in SQLite.',
+            buckets=INGEST_BUCKETS,
+        ))
+        self.publish = self.registry.add(Histogram(
+            'boardresults_ingest_publish_seconds', 'Time to rebuild indexes, ranks, stats and search.',
+            buckets=INGEST_BUCKETS,
+        ))
+        self.rows = self.registry.add(Counter(
+            'boardresults_ingest_rows_written_total', 'Rows written by ingest, by table.', ('table',),
+        ))
+        self.files = self.registry.add(Counter(
+            'boardresults_ingest_files_total', 'PDFs processed, by result.', ('result',),
+        ))
+        self.last_run = self.registry.add(Gauge(
+            'boardresults_ingest_last_run_timestamp_seconds', 'When ingest last wrote its metrics.',
+        ))
+
+    def file_loaded(self, timings, students, write_seconds):
+        extract, parse = timings
+        self.extract.observe(extract)
+        self.parse.observe(parse)
+        self.write.observe(write_seconds)
+        self.rows.inc(len(students), table='students')
+        self.rows.inc(sum(len(s['subjects']) for s in students), table='marks')
+        self.files.inc(result='loaded')
+
+    def file_failed(self):
+        self.files.inc(result='failed')
+
+    def save(self, path=INGEST_METRICS_FILE):
+        self.last_run.set(time.time())
+        self.registry.write_textfile(path)
@@ -0,0 +1,57 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class PageCache:
+    """LRU cache of rendered pages, bounded by the total size of the bodies.
+
+    Every entry belongs to one database version; looking up a newer version
+    drops the whole cache, so pages never outlive the data they show.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.version = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self.size = 0
+            self.version = version
+
+    def get(self, key, version):
+        """Return (body, etag) for `key`, or None."""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, body):
+        """Store a rendered body and return its (body, etag)."""
+        if isinstance(body, str):
+            body = body.encode()
+        entry = (body, hashlib.sha1(body).hexdigest())
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            self._check_version(version)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return entry
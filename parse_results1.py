@@ -1,7 +1,16 @@
+import argparse
+import hashlib
+import json
 import os
 import re
-import sqlite3
-from pdfminer.high_level import extract_text
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LAParams, LTTextContainer
+
+from db import connect_for_ingest, ensure_ingest_schema, publish, table_exists
+from metrics import IngestMetrics
+from shards import build_shards
 
 PDF_FOLDER = 'pdfs'
 DB_FILE = 'results.db'
@@ -15,148 +24,356 @@ def detect_group(line):
         return "Humanities"
     return None
 
-def parse_student_data(text):
-    students = []
-    current_group = None
-
-    lines = text.splitlines()
-    non_blank_lines = [line.strip() for line in lines if line.strip()]
+STUDENT_RE = re.compile(r"(\d{6})\[(\d\.\d{2})]:([^\n]+)")
+SUBJECT_RE = re.compile(r"(\d+):T:(\d+)")
+# Pattern 1: with school code in parentheses; pattern 2: without it
+SCHOOL_CODE_RE = re.compile(r'INSTITUTE NAME\s*:\s*(.+?)\s*\(\d+\)', re.IGNORECASE)
+SCHOOL_RE = re.compile(r'INSTITUTE NAME\s*:\s*(.+)', re.IGNORECASE)
+SCHOOL_TRAILER_RE = re.compile(r'[\d\(\)]+$')
+BOARD_LINES = 10
 
-    school_name = ""
-    board = ""
+# Plain top-to-bottom box ordering: result lists are a single column, and it
+# skips pdfminer's costly hierarchical box grouping.
+LAPARAMS = LAParams(boxes_flow=None)
 
-    # ✅ Improved school name extraction - handles multiple formats
-    school_line = None
-    for line in non_blank_lines:
-        if "INSTITUTE NAME" in line.upper():
-            school_line = line
-            break
-    
-    if school_line:
-        # Pattern 1: With school code in parentheses
-        match = re.search(r'INSTITUTE NAME\s*:\s*(.+?)\s*\(\d+\)', school_line, re.IGNORECASE)
-        if match:
-            school_name = match.group(1).strip()
-        else:
-            # Pattern 2: Without school code
-            match = re.search(r'INSTITUTE NAME\s*:\s*(.+)', school_line, re.IGNORECASE)
-            if match:
-                school_name = match.group(1).strip()
-            else:
-                # Fallback: Take everything after colon
-                if ':' in school_line:
-                    school_name = school_line.split(':', 1)[1].strip()
-        
-        # Clean up any trailing numbers or special characters
-        school_name = re.sub(r'[\d\(\)]+$', '', school_name).strip()
-        print(f"✅ School name detected: {school_name}")
+def parse_school_name(school_line):
+    match = SCHOOL_CODE_RE.search(school_line) or SCHOOL_RE.search(school_line)
+    if match:
+        school_name = match.group(1).strip()
+    elif ':' in school_line:
+        # Fallback: Take everything after colon
+        school_name = school_line.split(':', 1)[1].strip()
     else:
-        print("❌ Could not find 'INSTITUTE NAME' in document")
+        school_name = ""
+    # Clean up any trailing numbers or special characters
+    return SCHOOL_TRAILER_RE.sub('', school_name).strip()
 
-    # ✅ Extract board name from first few non-blank lines
-    for line in non_blank_lines[:10]:
-        if "BOARD OF" in line.upper():
-            board = line.strip()
-            break
+def iter_students(lines):
+    """Yield students from an iterable of text lines, one at a time.
+
+    Group, institute and board are carried across lines (and so across
+    pages); the board must appear in the first few non-blank lines and the
+    first INSTITUTE NAME line names the institute for what follows.
+    """
+    current_group = None
+    school_name = None
+    board = ""
+    non_blank = 0
 
-    # Process student results
     for line in lines:
         line = line.strip()
-        
+        if not line:
+            continue
+        non_blank += 1
+
+        # Student rows are nearly every line, so try them first.
+        if line[0].isdigit():
+            match = STUDENT_RE.match(line)
+            if match:
+                roll, gpa, subjects_raw = match.groups()
+                subject_data = {}
+                for part in subjects_raw.split(','):
+                    sub_match = SUBJECT_RE.match(part.strip())
+                    if sub_match:
+                        code, marks = sub_match.groups()
+                        subject_data[code] = marks
+
+                yield {
+                    'roll': roll,
+                    'gpa': float(gpa),
+                    'group': current_group,
+                    'subjects': subject_data,
+                    'school_name': school_name or "",
+                    'board': board
+                }
+                continue
+
+        upper = line.upper()
+        if school_name is None and "INSTITUTE NAME" in upper:
+            school_name = parse_school_name(line)
+            print(f"✅ School name detected: {school_name}")
+        if not board and non_blank <= BOARD_LINES and "BOARD OF" in upper:
+            board = line
+
         # Skip lines that are clearly not student data
-        if not line or "PERCENT" in line or "PASS" in line or "GPA5" in line:
+        if "PERCENT" in line or "PASS" in line or "GPA5" in line:
             continue
-            
-        detected = detect_group(line.upper())
+
+        detected = detect_group(upper)
         if detected:
             current_group = detected
-            continue
 
-        match = re.match(r"(\d{6})\[(\d\.\d{2})]:([^\n]+)", line)
-        if match:
-            roll, gpa, subjects_raw = match.groups()
-            subject_data = {}
-            for part in subjects_raw.split(','):
-                part = part.strip()
-                sub_match = re.match(r"(\d+):T:(\d+)", part)
-                if sub_match:
-                    code, marks = sub_match.groups()
-                    subject_data[code] = marks
-
-            students.append({
-                'roll': roll,
-                'gpa': float(gpa),
-                'group': current_group,
-                'subjects': subject_data,
-                'school_name': school_name,
-                'board': board
-            })
-
-    return students
-
-
-def ensure_table_and_columns(conn, subject_codes):
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS students (
-            roll TEXT PRIMARY KEY,
-            gpa REAL,
-            group_name TEXT,
-            school_name TEXT,
-            board TEXT
+    if school_name is None:
+        print("❌ Could not find 'INSTITUTE NAME' in document")
+
+def iter_pdf_lines(pdf_path, laparams=LAPARAMS):
+    """Yield the text lines of a PDF page by page, never the whole document."""
+    for page in extract_pages(pdf_path, laparams=laparams):
+        for element in page:
+            if isinstance(element, LTTextContainer):
+                yield from element.get_text().splitlines()
+
+def parse_student_data(text):
+    return list(iter_students(text.splitlines()))
+
+
+INSERT_STUDENT_SQL = """
+    INSERT OR REPLACE INTO students (roll, gpa, group_name, school_name, board, source_file)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+DELETE_MARKS_SQL = "DELETE FROM marks WHERE roll = ?"
+INSERT_MARKS_SQL = "INSERT INTO marks (roll, subject_code, marks) VALUES (?, ?, ?)"
+
+def _write_students(conn, students, source_file):
+    # A roll printed twice (e.g. repeated across a page break): the last
+    # row wins, as it did when every insert was an INSERT OR REPLACE.
+    students = {student['roll']: student for student in students}.values()
+    student_rows = []
+    marks_rows = []
+    for student in students:
+        student_rows.append((
+            student['roll'],
+            student['gpa'],
+            student.get('group'),
+            student.get('school_name', ''),
+            student.get('board', ''),
+            source_file
+        ))
+        marks_rows.extend(
+            (student['roll'], code, int(marks))
+            for code, marks in student['subjects'].items()
+        )
+
+    conn.executemany(INSERT_STUDENT_SQL, student_rows)
+    conn.executemany(DELETE_MARKS_SQL, [(row[0],) for row in student_rows])
+    conn.executemany(INSERT_MARKS_SQL, marks_rows)
+
+def insert_students(conn, students, source_file=None):
+    """Write a batch of students and their marks in a single transaction."""
+    with conn:
+        _write_students(conn, students, source_file)
+
+def _delete_file_students(conn, path, keep=()):
+    """Delete the rows loaded from `path`.
+
+    The web `student` rows of its rolls go too, except for the rolls in
+    `keep` (those the file still lists when it is re-ingested): sync_student
+    can update a row but the PDFs carry no names to re-create one.
+    """
+    if table_exists(conn, 'student'):
+        conn.execute(
+            """
+            DELETE FROM student WHERE roll_no IN (
+                SELECT CAST(roll AS INTEGER) FROM students
+                WHERE source_file = ? AND roll NOT IN (SELECT value FROM json_each(?))
+            )
+            """,
+            (path, json.dumps(list(keep))),
+        )
+    conn.execute(
+        "DELETE FROM marks WHERE roll IN (SELECT roll FROM students WHERE source_file = ?)",
+        (path,),
+    )
+    conn.execute("DELETE FROM students WHERE source_file = ?", (path,))
+
+def file_fingerprint(path):
+    """(sha256, mtime, size) of a file, hashed in 1 MiB chunks."""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest(), stat.st_mtime, stat.st_size
+
+def load_manifest(conn):
+    """path -> (sha256, mtime, size) for every file already ingested."""
+    return {
+        path: (sha256, mtime, size)
+        for path, sha256, mtime, size in conn.execute(
+            "SELECT path, sha256, mtime, size FROM ingest_manifest"
         )
-    """)
-    for code in subject_codes:
-        col = f'"{code}_marks"'
-        if not column_exists(conn, col):
-            cursor.execute(f'ALTER TABLE students ADD COLUMN {col} TEXT')
-    conn.commit()
-
-def column_exists(conn, col):
-    cursor = conn.execute("PRAGMA table_info(students)")
-    return any(col.strip('"') == row[1] for row in cursor.fetchall())
-
-def insert_student_data(conn, student):
-    cursor = conn.cursor()
-
-    base_columns = ['roll', 'gpa', 'group_name', 'school_name', 'board']
-    subject_columns = [f'"{code}_marks"' for code in student['subjects']]
-    all_columns = base_columns + subject_columns
-
-    placeholders = ','.join('?' * len(all_columns))
-    values = [
-        student['roll'],
-        student['gpa'],
-        student['group'],
-        student.get('school_name', ''),
-        student.get('board', '')
-    ] + list(student['subjects'].values())
-
-    sql = f"""
-        INSERT OR REPLACE INTO students ({','.join(all_columns)}) 
-        VALUES ({placeholders})
+    }
+
+def needs_ingest(conn, path, known, force=False):
+    """Fingerprint of `path` if it has to be (re)ingested, else None.
+
+    `known` is the file's manifest entry. A file whose mtime and size match it
+    is assumed unchanged without hashing; otherwise the SHA-256 decides, and a
+    file that was only touched just gets its manifest entry refreshed.
     """
-    cursor.execute(sql, values)
-    conn.commit()
-
-def process_pdfs():
-    conn = sqlite3.connect(DB_FILE)
-    for file in os.listdir(PDF_FOLDER):
-        if file.endswith('.pdf'):
-            print(f"📄 Processing {file}...")
-            pdf_path = os.path.join(PDF_FOLDER, file)
-            text = extract_text(pdf_path)
-            students = parse_student_data(text)
-            if not students:
-                print(f"⚠️  No students found in {file}")
-                continue
-            all_subjects = set(code for s in students for code in s['subjects'])
-            ensure_table_and_columns(conn, all_subjects)
-            for s in students:
-                insert_student_data(conn, s)
+    if not force and known:
+        stat = os.stat(path)
+        if (known[1], known[2]) == (stat.st_mtime, stat.st_size):
+            return None
+    fingerprint = file_fingerprint(path)
+    if not force and known and known[0] == fingerprint[0]:
+        with conn:
+            conn.execute(
+                "UPDATE ingest_manifest SET mtime = ?, size = ? WHERE path = ?",
+                (fingerprint[1], fingerprint[2], path),
+            )
+        return None
+    return fingerprint
+
+def changed_files(conn, paths, force=False):
+    """Split `paths` against the manifest.
+
+    Returns ({path: fingerprint} for new or changed files, [deleted paths]).
+    """
+    manifest = load_manifest(conn)
+    changed = {}
+    for path in paths:
+        fingerprint = needs_ingest(conn, path, manifest.get(path), force)
+        if fingerprint:
+            changed[path] = fingerprint
+    deleted = sorted(set(manifest) - set(paths))
+    return changed, deleted
+
+def replace_file_students(conn, path, fingerprint, students):
+    """Swap the rows loaded from `path` for `students` and record it."""
+    sha256, mtime, size = fingerprint
+    with conn:
+        _delete_file_students(conn, path, keep=[student['roll'] for student in students])
+        _write_students(conn, students, path)
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO ingest_manifest (path, sha256, mtime, size, students)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (path, sha256, mtime, size, len(students)),
+        )
+
+def forget_file(conn, path):
+    """Remove the rows and manifest entry of a PDF that no longer exists."""
+    with conn:
+        _delete_file_students(conn, path)
+        conn.execute("DELETE FROM ingest_manifest WHERE path = ?", (path,))
+
+def parse_pdf(pdf_path):
+    """Extract and parse one PDF; safe to run in a worker process."""
+    return list(iter_students(iter_pdf_lines(pdf_path)))
+
+def _timed_lines(lines, timer):
+    """Yield from `lines`, adding the time spent producing them to timer[0]."""
+    lines = iter(lines)
+    while True:
+        started = time.perf_counter()
+        try:
+            line = next(lines)
+        except StopIteration:
+            timer[0] += time.perf_counter() - started
+            return
+        timer[0] += time.perf_counter() - started
+        yield line
+
+def parse_pdf_timed(pdf_path):
+    """parse_pdf, also returning (extraction seconds, parsing seconds).
+
+    Extraction and parsing still stream into each other; the time spent
+    inside pdfminer is measured per line and the rest is parsing.
+    """
+    extract = [0.0]
+    started = time.perf_counter()
+    students = list(iter_students(_timed_lines(iter_pdf_lines(pdf_path), extract)))
+    return students, (extract[0], time.perf_counter() - started - extract[0])
+
+def _parsed_pdfs(paths, workers):
+    """Yield (path, (students, timings), error) as PDFs finish parsing."""
+    if workers == 1:
+        for path in paths:
+            try:
+                yield path, parse_pdf_timed(path), None
+            except Exception as e:
+                yield path, None, e
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(parse_pdf_timed, path): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+def process_pdfs(workers=None, force=False):
+    """Load new and changed PDFs in PDF_FOLDER into DB_FILE.
+
+    Files are compared against the ingest manifest: unchanged files are
+    skipped, changed files have their rows replaced and files that have been
+    removed from PDF_FOLDER have their rows deleted. `force` re-ingests
+    everything. With more than one worker, extraction and parsing run in a
+    process pool while this process stays the only writer to the SQLite
+    connection.
+    """
+    workers = workers or os.cpu_count() or 1
+    paths = [
+        os.path.join(PDF_FOLDER, file)
+        for file in sorted(os.listdir(PDF_FOLDER))
+        if file.endswith('.pdf')
+    ]
+    started = time.perf_counter()
+    loaded_files = loaded_students = 0
+    failures = []
+    ingest_metrics = IngestMetrics()
+
+    conn = connect_for_ingest(DB_FILE)
+    ensure_ingest_schema(conn)
+    changed, deleted = changed_files(conn, paths, force)
+    for path in deleted:
+        print(f"🗑️  {os.path.basename(path)} was removed, deleting its students")
+        forget_file(conn, path)
+
+    print(
+        f"📄 Processing {len(changed)} new or changed PDFs "
+        f"({len(paths) - len(changed)} unchanged) with {workers} worker(s)..."
+    )
+    for pdf_path, parsed, error in _parsed_pdfs(list(changed), workers):
+        file = os.path.basename(pdf_path)
+        if error is not None:
+            print(f"❌ Failed to process {file}: {error}")
+            failures.append(file)
+            ingest_metrics.file_failed()
+            continue
+        students, timings = parsed
+        if not students:
+            print(f"⚠️  No students found in {file}")
+        write_started = time.perf_counter()
+        try:
+            replace_file_students(conn, pdf_path, changed[pdf_path], students)
+        except Exception as e:
+            print(f"❌ Failed to load {file}: {e}")
+            failures.append(file)
+            ingest_metrics.file_failed()
+            continue
+        ingest_metrics.file_loaded(timings, students, time.perf_counter() - write_started)
+        loaded_files += 1
+        loaded_students += len(students)
+        print(f"✅ {file}: {len(students)} students")
+    if changed or deleted:
+        publish_started = time.perf_counter()
+        publish(conn)
+        ingest_metrics.publish.observe(time.perf_counter() - publish_started)
     conn.close()
-    print("✅ All PDFs processed.")
+    ingest_metrics.save()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"✅ All PDFs processed: {loaded_files} files, {loaded_students} students, "
+        f"{len(failures)} failures in {elapsed:.1f}s "
+        f"({loaded_files / elapsed:.2f} files/s, {loaded_students / elapsed:.1f} students/s)"
+    )
+    return failures
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load board result PDFs into the results database.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="parallel PDF parsing processes (default: one per CPU, 1 disables the pool)")
+    parser.add_argument('--force', action='store_true',
+                        help="re-ingest every PDF, ignoring the ingest manifest")
+    parser.add_argument('--shard-year', type=int, default=None,
+                        help="then rebuild the per-board shards of this exam year (see shards.py)")
+    args = parser.parse_args()
     os.makedirs(PDF_FOLDER, exist_ok=True)
-    process_pdfs()
+    process_pdfs(args.workers, args.force)
+    if args.shard_year is not None:
+        build_shards(args.shard_year, DB_FILE, workers=args.workers)
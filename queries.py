@@ -0,0 +1,392 @@
+import heapq
+import itertools
+import math
+import re
+
+from db import RANK_COLUMNS, table_exists
+
+PER_PAGE = 100
+# Rolls on the result sheets are six digits (see parse_results1.STUDENT_RE).
+ROLL_DIGITS = 6
+
+# Columns in the shape students.html expects.
+LEADERBOARD_COLUMNS = '''
+    student.roll_no AS roll,
+    student.name,
+    student.gpa,
+    student."group" AS "group",
+    student.institute AS school_name,
+    student.sum AS total_marks
+'''
+
+
+def _cohort_where(group, institute):
+    """WHERE clause for a leaderboard: GPA-5 board-wide, or one institute."""
+    if institute is None:
+        clauses, params = ['gpa = 5.0'], []
+    else:
+        clauses, params = ['institute = ?'], [institute]
+    if group and group.lower() != 'all':
+        clauses.append('"group" = ? COLLATE NOCASE')
+        params.append(group)
+    return ' AND '.join(clauses), params
+
+
+def leaderboard_page(conn, group='all', institute=None, page=1, per_page=PER_PAGE, subject=None):
+    """Return (students, page, total_pages) for one leaderboard page.
+
+    Filtering, ordering, ranking and pagination all happen in SQLite, so only
+    the rows on the requested page are read into Python. With `subject` (a
+    subject code) students are ordered by their marks in it, then by total;
+    those without marks in it come last.
+    """
+    where, params = _cohort_where(group, institute)
+    total = conn.execute(
+        f'SELECT COUNT(*) FROM student WHERE {where}', params
+    ).fetchone()[0]
+    total_pages = math.ceil(total / per_page)
+    page = max(1, min(page, total_pages))
+
+    if subject is None or not table_exists(conn, 'marks'):
+        join, order, subject_params = '', 'sum DESC, roll_no', []
+    else:
+        join = 'LEFT JOIN marks m ON m.roll = CAST(student.roll_no AS TEXT) AND m.subject_code = ?'
+        order, subject_params = 'm.marks DESC, sum DESC, roll_no', [subject]
+    rows = conn.execute(
+        f'''
+        SELECT {LEADERBOARD_COLUMNS},
+               ROW_NUMBER() OVER (ORDER BY {order}) AS rank
+        FROM student {join}
+        WHERE {where}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+        ''',
+        subject_params + params + [per_page, (page - 1) * per_page],
+    ).fetchall()
+    return [dict(row) for row in rows], page, total_pages
+
+
+def leaderboard_groups(conn, institute=None):
+    """Distinct groups present in a leaderboard's cohort."""
+    where, params = _cohort_where('all', institute)
+    return [row[0] for row in conn.execute(
+        f'SELECT DISTINCT "group" FROM student WHERE {where} AND "group" IS NOT NULL ORDER BY 1',
+        params,
+    )]
+
+
+def institutes(conn):
+    """Every institute name, alphabetically."""
+    return [row[0] for row in conn.execute(
+        'SELECT DISTINCT institute FROM student WHERE institute IS NOT NULL ORDER BY 1'
+    )]
+
+
+def students_by_rowid(conn, rowids, ranks):
+    """Leaderboard rows for `rowids`, in that order, with the given ranks."""
+    placeholders = ','.join('?' * len(rowids))
+    rows = conn.execute(
+        f'SELECT rowid AS student_id, {LEADERBOARD_COLUMNS} FROM student WHERE rowid IN ({placeholders})',
+        rowids,
+    ).fetchall()
+    by_rowid = {row['student_id']: row for row in rows}
+    students = []
+    for rowid, rank in zip(rowids, ranks):
+        student = dict(by_rowid[rowid])
+        del student['student_id']
+        student['rank'] = rank
+        students.append(student)
+    return students
+
+
+def _rank_column(group, institute):
+    """The student_rank column matching a leaderboard's ordering."""
+    grouped = bool(group) and group.lower() != 'all'
+    if institute is None:
+        return 'group_rank' if grouped else 'overall_rank'
+    return 'institute_group_rank' if grouped else 'institute_rank'
+
+
+def _rank_select(group, institute):
+    """Select-list item reading a row's leaderboard rank from student_rank."""
+    return f'''(SELECT r.{_rank_column(group, institute)} FROM student_rank r
+              WHERE r.student_id = student.rowid) AS rank'''
+
+
+def leaderboard_after(conn, group='all', institute=None, after=None, limit=PER_PAGE):
+    """Up to `limit` leaderboard rows following the keyset cursor `after`.
+
+    `after` is the (total_marks, roll) of the last row already seen. The
+    leaderboard indexes end in (sum DESC, roll_no): the `sum <= ?` bound
+    seeks to the cursor and rows are then read in index order up to
+    `limit`, so deep pages cost the same as the first one.
+    """
+    where, params = _cohort_where(group, institute)
+    if after is not None:
+        where += ' AND sum <= ? AND (sum < ? OR roll_no > ?)'
+        params += [after[0], after[0], after[1]]
+
+    if table_exists(conn, 'student_rank'):
+        rank = _rank_select(group, institute)
+    else:
+        rank = 'NULL AS rank'
+    rows = conn.execute(
+        f'''
+        SELECT {LEADERBOARD_COLUMNS}, {rank}
+        FROM student
+        WHERE {where}
+        ORDER BY sum DESC, roll_no
+        LIMIT ?
+        ''',
+        params + [limit],
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def iter_students(conn, group='all', institute=None):
+    """Stream every student (not only GPA 5) with ranks and marks, by roll.
+
+    Rows come straight off the SQLite cursor, so a full board never has to
+    be held in memory. Marks are "code:marks" pairs joined with commas.
+    """
+    clauses, params = [], []
+    if institute is not None:
+        clauses.append('institute = ?')
+        params.append(institute)
+    if group and group.lower() != 'all':
+        clauses.append('"group" = ? COLLATE NOCASE')
+        params.append(group)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    ranks = ', '.join(f'r.{col}' for col in RANK_COLUMNS)
+    rank_join = 'LEFT JOIN student_rank r ON r.student_id = student.rowid'
+    if not table_exists(conn, 'student_rank'):
+        ranks = ', '.join(f'NULL AS {col}' for col in RANK_COLUMNS)
+        rank_join = ''
+    marks = '''(SELECT group_concat(subject_code || ':' || marks) FROM marks
+               WHERE marks.roll = CAST(student.roll_no AS TEXT)) AS marks'''
+    if not table_exists(conn, 'marks'):
+        marks = 'NULL AS marks'
+
+    yield from conn.execute(
+        f'''
+        SELECT {LEADERBOARD_COLUMNS}, {ranks}, {marks}
+        FROM student {rank_join}
+        {where}
+        ORDER BY student.roll_no
+        ''',
+        params,
+    )
+
+
+def find_in_leaderboard(conn, roll, group='all', institute=None):
+    """Return the leaderboard entry for `roll` with its rank, or None.
+
+    The rank comes from the precomputed student_rank table. Databases that
+    have not been re-ingested yet fall back to counting the students ahead of
+    the match on the (…, sum) index.
+    """
+    where, params = _cohort_where(group, institute)
+    if table_exists(conn, 'student_rank'):
+        row = conn.execute(
+            f'''
+            SELECT {LEADERBOARD_COLUMNS}, {_rank_select(group, institute)}
+            FROM student
+            WHERE {where} AND roll_no = ?
+            ''',
+            params + [roll],
+        ).fetchone()
+        return dict(row) if row else None
+
+    row = conn.execute(
+        f'SELECT {LEADERBOARD_COLUMNS} FROM student WHERE {where} AND roll_no = ?',
+        params + [roll],
+    ).fetchone()
+    if row is None:
+        return None
+
+    student = dict(row)
+    total, roll_no = student['total_marks'], student['roll']
+    student['rank'] = conn.execute(
+        f'''
+        SELECT COUNT(*) + 1 FROM student
+        WHERE {where} AND (sum > ? OR (sum = ? AND roll_no < ?))
+        ''',
+        params + [total, total, roll_no],
+    ).fetchone()[0]
+    return student
+
+
+def student_ranks(conn, student_id):
+    """Every precomputed rank for one student, or an empty dict."""
+    if not table_exists(conn, 'student_rank'):
+        return {}
+    row = conn.execute(
+        f'SELECT {", ".join(RANK_COLUMNS)} FROM student_rank WHERE student_id = ?',
+        (student_id,),
+    ).fetchone()
+    return dict(zip(RANK_COLUMNS, row)) if row else {}
+
+
+def student_marks(conn, roll):
+    """Subject name -> marks for one roll from the normalized marks table."""
+    if not table_exists(conn, 'marks'):
+        return {}
+    rows = conn.execute(
+        '''
+        SELECT COALESCE(s.name, m.subject_code), m.marks
+        FROM marks m LEFT JOIN subjects s ON s.code = m.subject_code
+        WHERE m.roll = ?
+        ORDER BY m.subject_code
+        ''',
+        (str(roll),),
+    ).fetchall()
+    return dict(rows)
+
+
+STATS_COLUMNS = '''
+    name, group_name, candidates, gpa5, passed,
+    round(100.0 * passed / candidates, 2) AS pass_rate,
+    round(mean_total, 2) AS mean_total, median_total,
+    p10, p25, p75, p90, p99, top_total
+'''
+
+
+def cohort_stats(conn, scope, name=None):
+    """Precomputed stats rows of one scope (optionally one name), by name and group.
+
+    Reads only the cohort_stats table, so the cost does not depend on how
+    many students a cohort has.
+    """
+    if not table_exists(conn, 'cohort_stats'):
+        return []
+    where, params = 'scope = ?', [scope]
+    if name is not None:
+        where += ' AND name = ?'
+        params.append(name)
+    rows = conn.execute(
+        f"""
+        SELECT {STATS_COLUMNS} FROM cohort_stats WHERE {where}
+        ORDER BY name, group_name != 'all', group_name
+        """,
+        params,
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def top_institutes(conn, limit=20):
+    """Institutes with the most GPA-5 students, from cohort_stats."""
+    if not table_exists(conn, 'cohort_stats'):
+        return []
+    rows = conn.execute(
+        f"""
+        SELECT {STATS_COLUMNS} FROM cohort_stats
+        WHERE scope = 'institute' AND group_name = 'all'
+        ORDER BY gpa5 DESC
+        LIMIT ?
+        """,
+        (limit,),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def subject_names(conn):
+    """Subject code -> name from the subjects table."""
+    if not table_exists(conn, 'subjects'):
+        return {}
+    return dict(conn.execute('SELECT code, name FROM subjects'))
+
+
+SEARCH_LIMIT = 20
+SEARCH_TOKEN_RE = re.compile(r'\w+')
+
+
+def fts_prefix_query(text):
+    """FTS5 query matching every word of `text`, the last one as a prefix.
+
+    Words are quoted, so user input can never be read as FTS5 syntax.
+    Returns None when `text` has no words.
+    """
+    words = SEARCH_TOKEN_RE.findall(text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def search_institutes(conn, text, limit=SEARCH_LIMIT):
+    """Institutes whose name matches `text` as typed so far, best first."""
+    query = fts_prefix_query(text)
+    if query is None or not table_exists(conn, 'institute_search'):
+        return []
+    rows = conn.execute(
+        '''
+        SELECT institute, candidates FROM institute_search
+        WHERE institute_search MATCH ?
+        ORDER BY rank
+        LIMIT ?
+        ''',
+        (query, limit),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def search_students(conn, text, limit=SEARCH_LIMIT):
+    """Students matching `text`: by roll if it looks like one, else by name.
+
+    Name matches also match on institute words, so "rahim chittagong" finds
+    the Rahims of Chittagong institutes. Longer numbers cannot be a roll
+    (nor fit an SQLite integer) and go to the full-text search.
+    """
+    text = text.strip()
+    if text.isascii() and text.isdigit() and len(text) <= ROLL_DIGITS:
+        rows = conn.execute(
+            f'SELECT {LEADERBOARD_COLUMNS} FROM student WHERE roll_no = ?', (int(text),)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    query = fts_prefix_query(text)
+    if query is None or not table_exists(conn, 'student_search'):
+        return []
+    rows = conn.execute(
+        f'''
+        SELECT {LEADERBOARD_COLUMNS}
+        FROM student_search JOIN student ON student.rowid = student_search.rowid
+        WHERE student_search MATCH ?
+        ORDER BY student_search.rank
+        LIMIT ?
+        ''',
+        (query, limit),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def merged_leaderboard_after(conns, group='all', institute=None, after=None, limit=PER_PAGE):
+    """Keyset leaderboard page across several shards (slug -> connection).
+
+    Every shard returns its own next `limit` rows after the cursor, already
+    in leaderboard order, and the pages are merged; a shard never has to
+    rank more than one page. The national rank of the first row is one more
+    than the rows at or before the cursor, counted per shard on the
+    (…, sum DESC, roll_no) indexes. Each row's shard rank is kept as `board_rank`.
+    """
+    where, params = _cohort_where(group, institute)
+    ahead = 0
+    if after is not None:
+        for conn in conns.values():
+            ahead += conn.execute(
+                f'SELECT COUNT(*) FROM student WHERE {where} AND sum >= ? AND (sum > ? OR roll_no <= ?)',
+                params + [after[0], after[0], after[1]],
+            ).fetchone()[0]
+
+    pages = []
+    for slug, conn in conns.items():
+        page = leaderboard_after(conn, group, institute, after, limit)
+        for student in page:
+            student['board'] = slug
+            student['board_rank'] = student.pop('rank')
+        pages.append(page)
+    merged = heapq.merge(*pages, key=lambda student: (-student['total_marks'], student['roll']))
+    students = list(itertools.islice(merged, limit))
+    for rank, student in enumerate(students, ahead + 1):
+        student['rank'] = rank
+    return students
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from db import DB_FILE, ensure_ingest_schema, publish, read_connection, table_exists
+
+SHARD_DIR = 'shards'
+CATALOG_FILE = os.path.join(SHARD_DIR, 'catalog.db')
+
+# One row per shard: the students of one education board in one exam year.
+# `signature` describes the source rows the shard was built from, so a
+# rebuild can skip boards that did not change.
+CATALOG_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS shards (
+        slug TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        boards TEXT NOT NULL,
+        path TEXT NOT NULL,
+        signature TEXT NOT NULL,
+        students INTEGER NOT NULL,
+        built_at REAL NOT NULL,
+        PRIMARY KEY (slug, year)
+    )
+"""
+
+# A shard is written once into a scratch file and never modified after it
+# is swapped in, so durability only matters at the very end (see _fsync).
+BUILD_PRAGMAS = (
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+def board_slug(board):
+    """URL and file name for a board: "BOARD OF ..., CHATTOGRAM" -> "chattogram"."""
+    name = board.rsplit(',', 1)[-1].lower()
+    return re.sub(r'[^a-z0-9]+', '-', name).strip('-') or 'unknown'
+
+
+def shard_file(year, slug, directory=SHARD_DIR):
+    return os.path.join(directory, str(year), f'{slug}.db')
+
+
+def board_signatures(conn):
+    """slug -> (board names, signature) for every board in the source database.
+
+    The signature covers the web rows of the board's students and the
+    hashes of the PDFs they were parsed from.
+    """
+    totals = conn.execute("""
+        SELECT COALESCE(b.board, ''), count(*) || ':' || total(st.sum) || ':' || total(st.gpa)
+        FROM student st JOIN students b ON b.roll = CAST(st.roll_no AS TEXT)
+        GROUP BY 1
+    """).fetchall()
+    files = dict(conn.execute("""
+        SELECT board, group_concat(sha256) FROM (
+            SELECT DISTINCT COALESCE(s.board, '') AS board, m.sha256
+            FROM students s JOIN ingest_manifest m ON m.path = s.source_file
+            ORDER BY 1, 2
+        ) GROUP BY board
+    """))
+    slugs = {}
+    for board, signature in sorted(totals):
+        boards, parts = slugs.setdefault(board_slug(board), ([], []))
+        boards.append(board)
+        parts.append(f'{board}={signature}:{files.get(board, "")}')
+    return {slug: (boards, '|'.join(parts)) for slug, (boards, parts) in slugs.items()}
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def build_shard(source, boards, path):
+    """Copy the students of `boards` from `source` into a new shard at `path`.
+
+    The shard is built next to its final path, published (indexes, ranks,
+    stats, search) and then renamed over the previous shard, so readers see
+    either the old file or the complete new one. Safe to run in a worker
+    process; returns the number of students in the shard.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    scratch = f'{path}.{os.getpid()}.tmp'
+    if os.path.exists(scratch):
+        os.remove(scratch)
+
+    # Opened as a URI so that the source can be attached read-only.
+    conn = sqlite3.connect(Path(scratch).resolve().as_uri(), uri=True)
+    try:
+        for pragma in BUILD_PRAGMAS:
+            conn.execute(pragma)
+        ensure_ingest_schema(conn)
+        conn.execute('ATTACH DATABASE ? AS src', (Path(source).resolve().as_uri() + '?mode=ro',))
+        selected = json.dumps(boards)
+        with conn:
+            conn.execute(conn.execute(
+                "SELECT sql FROM src.sqlite_master WHERE type = 'table' AND name = 'student'"
+            ).fetchone()[0])
+            conn.execute("""
+                INSERT INTO student SELECT st.* FROM src.student st
+                JOIN src.students b ON b.roll = CAST(st.roll_no AS TEXT)
+                WHERE COALESCE(b.board, '') IN (SELECT value FROM json_each(?))
+            """, (selected,))
+            conn.execute("""
+                INSERT INTO students (roll, gpa, group_name, school_name, board, source_file)
+                SELECT roll, gpa, group_name, school_name, board, source_file FROM src.students
+                WHERE COALESCE(board, '') IN (SELECT value FROM json_each(?))
+            """, (selected,))
+            conn.execute("""
+                INSERT INTO marks (roll, subject_code, marks)
+                SELECT m.roll, m.subject_code, m.marks FROM src.marks m
+                JOIN students b ON b.roll = m.roll
+            """)
+            conn.execute('INSERT OR REPLACE INTO subjects (code, name) SELECT code, name FROM src.subjects')
+            conn.execute("""
+                INSERT INTO ingest_manifest SELECT * FROM src.ingest_manifest
+                WHERE path IN (SELECT source_file FROM students)
+            """)
+        conn.execute('DETACH DATABASE src')
+        publish(conn, snapshot_dir=None)
+        students = conn.execute('SELECT count(*) FROM student').fetchone()[0]
+    finally:
+        conn.close()
+
+    _fsync(scratch)
+    os.replace(scratch, path)
+    return students
+
+
+def connect_catalog(path=CATALOG_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(CATALOG_SCHEMA)
+    return conn
+
+
+def build_shards(year, source=DB_FILE, directory=SHARD_DIR, workers=None, force=False):
+    """Split `source` into one shard per education board for exam `year`.
+
+    Only boards whose signature changed since the last build are rebuilt,
+    in parallel; shards of boards that disappeared from `source` are
+    removed. Returns the slugs that were rebuilt.
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    source_conn = sqlite3.connect(source)
+    try:
+        if not (table_exists(source_conn, 'student') and table_exists(source_conn, 'students')):
+            print(f"❌ {source} has no student/students tables to shard")
+            return []
+        current = board_signatures(source_conn)
+    finally:
+        source_conn.close()
+
+    catalog = connect_catalog(os.path.join(directory, os.path.basename(CATALOG_FILE)))
+    built = {
+        slug: signature
+        for slug, signature in catalog.execute('SELECT slug, signature FROM shards WHERE year = ?', (year,))
+    }
+    stale = {
+        slug: boards for slug, (boards, signature) in current.items()
+        if force or built.get(slug) != signature
+    }
+    print(f"🧩 Building {len(stale)} of {len(current)} board shard(s) for {year} with {workers} worker(s)...")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(build_shard, source, boards, shard_file(year, slug, directory)): slug
+            for slug, boards in stale.items()
+        }
+        for future in as_completed(futures):
+            slug = futures[future]
+            try:
+                students = future.result()
+            except Exception as e:
+                print(f"❌ Failed to build shard {year}/{slug}: {e}")
+                continue
+            with catalog:
+                catalog.execute(
+                    'INSERT OR REPLACE INTO shards VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (slug, year, json.dumps(current[slug][0]), shard_file(year, slug, directory),
+                     current[slug][1], students, time.time()),
+                )
+            print(f"✅ {year}/{slug}: {students} students")
+
+    for slug in set(built) - set(current):
+        with catalog:
+            catalog.execute('DELETE FROM shards WHERE slug = ? AND year = ?', (slug, year))
+        try:
+            os.remove(shard_file(year, slug, directory))
+        except FileNotFoundError:
+            pass
+        print(f"🗑️  {year}/{slug} no longer has students, removed its shard")
+    catalog.close()
+    print(f"✅ Shards ready in {time.perf_counter() - started:.1f}s")
+    return list(stale)
+
+
+# Web side. Shard files are only ever replaced, never written in place, so
+# they are opened immutable: no locking and no change detection per query.
+
+def _catalog():
+    if not os.path.exists(CATALOG_FILE):
+        return None
+    return read_connection(CATALOG_FILE)
+
+
+def shard_catalog():
+    """Every shard, newest year first."""
+    conn = _catalog()
+    if conn is None:
+        return []
+    return [
+        dict(row, boards=json.loads(row['boards'])) for row in conn.execute(
+            'SELECT slug, year, boards, students, built_at FROM shards ORDER BY year DESC, slug'
+        )
+    ]
+
+
+def shard_connection(slug, year=None):
+    """Read connection to one board's shard (its latest year by default), or None."""
+    conn = _catalog()
+    if conn is None:
+        return None
+    row = conn.execute(
+        'SELECT path FROM shards WHERE slug = ? AND (? IS NULL OR year = ?) ORDER BY year DESC LIMIT 1',
+        (slug, year, year),
+    ).fetchone()
+    if row is None or not os.path.exists(row['path']):
+        return None
+    return read_connection(row['path'], immutable=True)
+
+
+def year_connections(year):
+    """slug -> read connection for every board shard of `year`."""
+    conn = _catalog()
+    if conn is None:
+        return {}
+    return {
+        row['slug']: read_connection(row['path'], immutable=True)
+        for row in conn.execute('SELECT slug, path FROM shards WHERE year = ? ORDER BY slug', (year,))
+        if os.path.exists(row['path'])
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the results database into per-board shards.")
+    parser.add_argument('year', type=int, help="exam year the results belong to")
+    parser.add_argument('--source', default=DB_FILE, help="database to split (default: results.db)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="shards built in parallel (default: one per CPU)")
+    parser.add_argument('--force', action='store_true', help="rebuild every shard")
+    args = parser.parse_args()
+    build_shards(args.year, args.source, workers=args.workers, force=args.force)
@@ -0,0 +1,208 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy the web app ranks in SQLite
+    np = None
+
+SNAPSHOT_DIR = 'results_snapshot'
+CURRENT_FILE = 'CURRENT'
+RELOAD_CHECK_SECONDS = 1.0
+MAX_CACHED_ORDERS = 64
+MISSING_MARKS = -1
+
+
+def write_snapshot(conn, version, directory=SNAPSHOT_DIR):
+    """Dump the `student` table as NumPy column files for the ranking engine.
+
+    Each version is written to its own `v<version>` directory and then made
+    current by atomically replacing the CURRENT pointer, so readers never see
+    a half-written snapshot. Returns the snapshot path, or None when NumPy or
+    the student table is missing.
+    """
+    if np is None:
+        return None
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if 'student' not in tables:
+        return None
+
+    rows = conn.execute(
+        'SELECT rowid, roll_no, gpa, lower("group"), institute, sum FROM student ORDER BY rowid'
+    ).fetchall()
+    groups = sorted({row[3] or '' for row in rows})
+    institutes = sorted({row[4] or '' for row in rows})
+    group_ids = {name: i for i, name in enumerate(groups)}
+    institute_ids = {name: i for i, name in enumerate(institutes)}
+
+    columns = {
+        'rowid': np.array([row[0] for row in rows], dtype=np.int64),
+        'roll': np.array([int(row[1]) for row in rows], dtype=np.int64),
+        'gpa': np.array([row[2] for row in rows], dtype=np.float64),
+        'group': np.array([group_ids[row[3] or ''] for row in rows], dtype=np.int16),
+        'institute': np.array([institute_ids[row[4] or ''] for row in rows], dtype=np.int32),
+        'sum': np.array([row[5] for row in rows], dtype=np.float64),
+    }
+
+    subject_codes = []
+    marks = np.full((len(rows), 0), MISSING_MARKS, dtype=np.int16)
+    if 'marks' in tables:
+        subject_codes = [row[0] for row in conn.execute(
+            'SELECT DISTINCT subject_code FROM marks ORDER BY subject_code'
+        )]
+        code_ids = {code: i for i, code in enumerate(subject_codes)}
+        row_ids = {str(row[1]): i for i, row in enumerate(rows)}
+        marks = np.full((len(rows), len(subject_codes)), MISSING_MARKS, dtype=np.int16)
+        cells = [
+            (row_ids[roll], code_ids[code], value)
+            for roll, code, value in conn.execute('SELECT roll, subject_code, marks FROM marks')
+            if roll in row_ids and value is not None
+        ]
+        if cells:
+            i, j, values = zip(*cells)
+            marks[list(i), list(j)] = values
+    columns['marks'] = marks
+
+    os.makedirs(directory, exist_ok=True)
+    name = f'v{version}'
+    path = os.path.join(directory, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    for column, array in columns.items():
+        np.save(os.path.join(path, f'{column}.npy'), array)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({
+            'version': version,
+            'groups': groups,
+            'institutes': institutes,
+            'subject_codes': subject_codes,
+        }, f)
+
+    pointer = os.path.join(directory, CURRENT_FILE)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(name)
+    os.replace(pointer + '.tmp', pointer)
+
+    # Readers still holding an older version keep their mappings after unlink.
+    for old in os.listdir(directory):
+        if old.startswith('v') and old != name:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return path
+
+
+class Snapshot:
+    """One memory-mapped snapshot of the student table."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.version = meta['version']
+        self.groups = {name: i for i, name in enumerate(meta['groups'])}
+        self.institutes = {name: i for i, name in enumerate(meta['institutes'])}
+        # Snapshots written without the marks matrix can only rank by total.
+        self.subject_codes = {code: i for i, code in enumerate(meta.get('subject_codes', []))}
+
+        def load(column):
+            return np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r')
+
+        self.rowid = load('rowid')
+        self.roll = load('roll')
+        self.gpa = load('gpa')
+        self.group = load('group')
+        self.institute = load('institute')
+        self.sum = load('sum')
+        self.marks = load('marks') if self.subject_codes else None
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def _mask(self, group, institute):
+        """Boolean cohort mask: GPA-5 board-wide, or one institute."""
+        if institute is None:
+            mask = self.gpa == 5.0
+        elif institute in self.institutes:
+            mask = self.institute == self.institutes[institute]
+        else:
+            return np.zeros(len(self.rowid), dtype=bool)
+        if group and group.lower() != 'all':
+            code = self.groups.get(group.lower())
+            if code is None:
+                return np.zeros(len(self.rowid), dtype=bool)
+            mask &= self.group == code
+        return mask
+
+    def order(self, group='all', institute=None, subject=None):
+        """Row indices of a cohort in rank order.
+
+        Students are ordered by total marks (or by marks in `subject`, then
+        total), ties broken by roll, matching the SQL leaderboard. A student
+        without marks in `subject` sorts after those with them. Orders are
+        cached per cohort for the lifetime of the snapshot.
+        """
+        key = ((group or 'all').lower(), institute, subject)
+        with self._lock:
+            cached = self._orders.get(key)
+        if cached is not None:
+            return cached
+
+        idx = np.flatnonzero(self._mask(group, institute))
+        keys = [self.roll[idx], -self.sum[idx]]
+        if subject in self.subject_codes:
+            keys.append(-self.marks[idx, self.subject_codes[subject]])
+        ordered = idx[np.lexsort(keys)]
+        with self._lock:
+            if len(self._orders) >= MAX_CACHED_ORDERS:
+                self._orders.clear()
+            self._orders[key] = ordered
+        return ordered
+
+    def leaderboard_page(self, group='all', institute=None, page=1, per_page=100, subject=None):
+        """Return (rowids, ranks, page, total_pages) for one leaderboard page."""
+        ordered = self.order(group, institute, subject)
+        total_pages = -(-len(ordered) // per_page)
+        page = max(1, min(page, total_pages))
+        start = (page - 1) * per_page
+        rowids = ordered[start:start + per_page]
+        return self.rowid[rowids].tolist(), list(range(start + 1, start + 1 + len(rowids))), page, total_pages
+
+
+class SnapshotEngine:
+    """Keeps the newest snapshot loaded.
+
+    The CURRENT pointer is checked at most once per RELOAD_CHECK_SECONDS, and
+    a new snapshot is mapped when the ingest step has replaced it.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+        self.snapshot = None
+        self._pointer_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return self.snapshot
+        with self._lock:
+            self._checked_at = now
+            pointer = os.path.join(self.directory, CURRENT_FILE)
+            try:
+                mtime = os.stat(pointer).st_mtime_ns
+                if mtime != self._pointer_mtime:
+                    with open(pointer) as f:
+                        self.snapshot = Snapshot(os.path.join(self.directory, f.read().strip()))
+                    self._pointer_mtime = mtime
+            except FileNotFoundError:
+                self.snapshot, self._pointer_mtime = None, None
+        return self.snapshot
+
+
+_engine = SnapshotEngine() if np is not None else None
+
+
+def current_snapshot():
+    """This process's latest snapshot, or None if the engine is unavailable."""
+    return _engine.current() if _engine is not None else None
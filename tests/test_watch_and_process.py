@@ -0,0 +1,75 @@
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.generate import generate_board, institute_lines, write_pdf  # noqa: E402
+from watch_and_process import settle_state  # noqa: E402
+
+
+def published(db):
+    if not os.path.exists(db):
+        return False
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'db_meta'").fetchone() is not None
+    finally:
+        conn.close()
+
+
+class SettleStateTest(unittest.TestCase):
+    def test_truncated_pdf_is_stuck_until_rewritten(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'a.pdf')
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-1.4\n' + b'x' * 3000)
+            entry = [0.0, 0.0, None, False]
+            self.assertEqual(settle_state(path, entry, 0.0, 2.0), 'settling')
+            self.assertEqual(settle_state(path, entry, 1.0, 2.0), 'settling')
+            self.assertEqual(settle_state(path, entry, 2.5, 2.0), 'stuck')
+
+            entry[3] = True
+            write_pdf(path, ['INSTITUTE NAME : X COLLEGE (1)'])
+            self.assertEqual(settle_state(path, entry, 3.0, 2.0), 'settling')
+            self.assertFalse(entry[3])
+            self.assertEqual(settle_state(path, entry, 5.5, 2.0), 'ready')
+
+            os.remove(path)
+            self.assertEqual(settle_state(path, entry, 6.0, 2.0), 'gone')
+
+
+class WatchTest(unittest.TestCase):
+    def test_stuck_file_does_not_block_publish(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, 'pdfs'))
+            watcher = subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, 'watch_and_process.py'),
+                 '--watch', '--poll', '--settle', '0.3', '--workers', '1'],
+                cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                time.sleep(1)
+                with open(os.path.join(tmp, 'pdfs', 'truncated.pdf'), 'wb') as f:
+                    f.write(b'%PDF-1.4\n' + b'x' * 3000)
+                name, code, students = generate_board(students=50, per_institute=50)[0]
+                write_pdf(os.path.join(tmp, 'pdfs', 'valid.pdf'), institute_lines(name, code, students))
+
+                db = os.path.join(tmp, 'results.db')
+                deadline = time.monotonic() + 30
+                while not published(db) and time.monotonic() < deadline:
+                    time.sleep(0.2)
+                self.assertTrue(published(db), 'the wave was never published')
+            finally:
+                watcher.send_signal(signal.SIGINT)
+                watcher.wait(10)
+
+
+if __name__ == '__main__':
+    unittest.main()
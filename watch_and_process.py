@@ -1,79 +1,249 @@
+import argparse
+import ctypes
+import ctypes.util
 import os
-import re
-import sqlite3
-from pdfminer.high_level import extract_text
-
-PDF_FOLDER = 'pdfs'
-DB_FILE = 'results.db'
-
-# Extract roll, GPA, and subjects with marks
-def parse_student_data(text):
-    students = []
-    for match in re.finditer(r"(\d{6})\[(\d\.\d{2})]:([^\n]+)", text):
-        roll, gpa, subjects_raw = match.groups()
-        subject_data = {}
-        for part in subjects_raw.split(','):
-            part = part.strip()
-            subject_match = re.match(r"(\d+):T:(\d+)", part)
-            if subject_match:
-                code, marks = subject_match.groups()
-                subject_data[code] = marks
-        students.append({
-            'roll': roll,
-            'gpa': float(gpa),
-            'subjects': subject_data
-        })
-    return students
-
-# Ensure table and dynamic columns
-def ensure_table_and_columns(conn, subject_codes):
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS students (
-            roll TEXT PRIMARY KEY,
-            gpa REAL
-        )
-    """)
-    for code in subject_codes:
-        col = f'"{code}_marks"'
-        cursor.execute(f"""
-            ALTER TABLE students ADD COLUMN {col} TEXT
-        """) if not column_exists(conn, col) else None
-    conn.commit()
-
-def column_exists(conn, col):
-    cursor = conn.execute("PRAGMA table_info(students)")
-    return any(col.strip('"') == row[1] for row in cursor.fetchall())
-
-# Insert or update data
-def insert_student_data(conn, student):
-    cursor = conn.cursor()
-    columns = ['roll', 'gpa'] + [f'"{code}_marks"' for code in student['subjects']]
-    placeholders = ','.join('?' * len(columns))
-    values = [student['roll'], student['gpa']] + list(student['subjects'].values())
-    sql = f"""
-        INSERT OR REPLACE INTO students ({','.join(columns)}) 
-        VALUES ({placeholders})
+import select
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from db import connect_for_ingest, ensure_ingest_schema, publish
+from metrics import IngestMetrics
+from parse_results1 import (
+    PDF_FOLDER, DB_FILE, forget_file, load_manifest, needs_ingest, parse_pdf_timed,
+    process_pdfs, replace_file_students,
+)
+
+SETTLE_SECONDS = 2.0
+POLL_SECONDS = 1.0
+STATUS_SECONDS = 30.0
+
+# inotify(7) event masks
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Report paths of PDFs touched in `folder`, via Linux inotify."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed on {folder}')
+
+    def poll(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode()
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: treat every PDF as touched.
+                paths.update(pdf_paths(self.folder))
+            elif name.endswith('.pdf'):
+                paths.add(os.path.join(self.folder, name))
+        return paths
+
+
+class PollingWatcher:
+    """Portable fallback: rescan `folder` and report PDFs whose stat changed."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.seen = self._scan()
+
+    def _scan(self):
+        seen = {}
+        for path in pdf_paths(self.folder):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            seen[path] = (stat.st_mtime, stat.st_size)
+        return seen
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+        seen = self._scan()
+        paths = {p for p in seen.keys() | self.seen.keys() if seen.get(p) != self.seen.get(p)}
+        self.seen = seen
+        return paths
+
+
+def pdf_paths(folder):
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith('.pdf')]
+
+
+def looks_complete(path):
+    """A fully written PDF ends with an %%EOF marker."""
+    with open(path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(path) - 1024))
+        return b'%%EOF' in f.read()
+
+
+def settle_state(path, entry, now, settle):
+    """Where a touched file is in the debounce: 'gone', 'settling', 'stuck' or 'ready'.
+
+    `entry` is the file's pending entry and is updated in place. A file that
+    has been unchanged for `settle` seconds but still does not end in %%EOF
+    (a truncated upload, not a PDF at all) is 'stuck': it stays pending in
+    case it is rewritten, but no longer holds back publishing.
+    """
+    try:
+        stat = os.stat(path)
+        if entry[2] != (stat.st_mtime, stat.st_size):
+            entry[1], entry[2], entry[3] = now, (stat.st_mtime, stat.st_size), False
+            return 'settling'
+        if now - entry[1] < settle:
+            return 'settling'
+        if entry[3]:
+            return 'stuck'
+        return 'ready' if looks_complete(path) else 'stuck'
+    except FileNotFoundError:
+        return 'gone'
+
+
+def make_watcher(folder, polling=False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folder)
+        except OSError as e:
+            print(f"⚠️  inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(folder)
+
+
+def watch(workers=None, settle=SETTLE_SECONDS, polling=False):
+    """Ingest PDFs as they land in PDF_FOLDER until interrupted.
+
+    Touched files are debounced until their size and mtime have been stable
+    for `settle` seconds and they end in %%EOF, then parsed in a process pool.
+    A wave is published once nothing is settling or parsing; files that
+    settled without %%EOF are logged as stuck and do not hold it back.
+    This process is the only writer; the database is in WAL mode, so the web
+    app keeps serving while results are loaded.
     """
-    cursor.execute(sql, values)
-    conn.commit()
-
-# Process all PDFs
-def process_pdfs():
-    conn = sqlite3.connect(DB_FILE)
-    for file in os.listdir(PDF_FOLDER):
-        if file.endswith('.pdf'):
-            pdf_path = os.path.join(PDF_FOLDER, file)
-            print(f"Processing {file}...")
-            text = extract_text(pdf_path)
-            students = parse_student_data(text)
-            all_subjects = set(code for s in students for code in s['subjects'])
-            ensure_table_and_columns(conn, all_subjects)
-            for s in students:
-                insert_student_data(conn, s)
-    conn.close()
-    print("✅ All PDFs processed.")
+    workers = workers or os.cpu_count() or 1
+    watcher = make_watcher(PDF_FOLDER, polling)
+    # Catch up on anything that arrived while we were not running.
+    process_pdfs(workers)
+    print(f"👀 Watching {PDF_FOLDER}/ with {type(watcher).__name__} and {workers} worker(s)")
+
+    conn = connect_for_ingest(DB_FILE)
+    ensure_ingest_schema(conn)
+    pending = {}    # path -> [first seen, last change, (mtime, size), stuck]
+    in_flight = {}  # path -> (future, first seen, fingerprint)
+    dirty = False
+    last_status = time.monotonic()
+    ingest_metrics = IngestMetrics()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            while True:
+                now = time.monotonic()
+                settling = any(not entry[3] for entry in pending.values())
+                for path in watcher.poll(min(POLL_SECONDS, settle / 2) if settling else POLL_SECONDS):
+                    entry = pending.setdefault(path, [now, now, None, False])
+                    entry[1] = now
+
+                # Debounce: submit files that have stopped changing.
+                for path, entry in list(pending.items()):
+                    if path in in_flight:
+                        continue
+                    if not os.path.exists(path):
+                        del pending[path]
+                        if path in load_manifest(conn):
+                            forget_file(conn, path)
+                            dirty = True
+                            print(f"🗑️  {os.path.basename(path)} was removed, deleted its students")
+                        continue
+                    state = settle_state(path, entry, now, settle)
+                    if state == 'stuck' and not entry[3]:
+                        entry[3] = True
+                        print(f"⚠️  {os.path.basename(path)} has not changed for {settle:g}s but does not "
+                              "end in %%EOF; skipping it until it is rewritten")
+                    if state != 'ready':
+                        continue
+                    del pending[path]
+                    fingerprint = needs_ingest(conn, path, load_manifest(conn).get(path))
+                    if fingerprint is None:
+                        continue
+                    in_flight[path] = (pool.submit(parse_pdf_timed, path), entry[0], fingerprint)
+
+                # Single writer: load whatever the workers have finished.
+                for path, (future, first_seen, fingerprint) in list(in_flight.items()):
+                    if not future.done():
+                        continue
+                    del in_flight[path]
+                    file = os.path.basename(path)
+                    try:
+                        students, timings = future.result()
+                    except Exception as e:
+                        print(f"❌ Failed to process {file}: {e}")
+                        ingest_metrics.file_failed()
+                        continue
+                    write_started = time.perf_counter()
+                    try:
+                        replace_file_students(conn, path, fingerprint, students)
+                    except Exception as e:
+                        print(f"❌ Failed to load {file}: {e}")
+                        ingest_metrics.file_failed()
+                        continue
+                    ingest_metrics.file_loaded(timings, students, time.perf_counter() - write_started)
+                    dirty = True
+                    print(f"✅ {file}: {len(students)} students, "
+                          f"{time.monotonic() - first_seen:.1f}s from first event to loaded")
+
+                if dirty and not in_flight and all(entry[3] for entry in pending.values()):
+                    publish_started = time.perf_counter()
+                    publish(conn)
+                    ingest_metrics.publish.observe(time.perf_counter() - publish_started)
+                    ingest_metrics.save()
+                    dirty = False
+                    print("🏁 Wave loaded and published")
+
+                if time.monotonic() - last_status >= STATUS_SECONDS:
+                    last_status = time.monotonic()
+                    stuck = sum(entry[3] for entry in pending.values())
+                    print(f"📊 Queue depth: {len(pending) - stuck} settling, {stuck} stuck, "
+                          f"{len(in_flight)} parsing")
+        except KeyboardInterrupt:
+            print("👋 Stopping watcher")
+        finally:
+            conn.close()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load board result PDFs as they arrive.")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and ingest new or changed PDFs as they appear")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="parallel PDF parsing processes (default: one per CPU)")
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help="seconds a file must stay unchanged before it is ingested")
+    parser.add_argument('--poll', action='store_true',
+                        help="use directory polling instead of inotify")
+    args = parser.parse_args()
     os.makedirs(PDF_FOLDER, exist_ok=True)
-    process_pdfs()
+    if args.watch:
+        watch(args.workers, args.settle, args.poll)
+    else:
+        process_pdfs(args.workers)